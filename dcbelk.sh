@@ -2,7 +2,7 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Fri Jan 17, 2020 at 05:00 AM -0500
+# Last Change: Mon Oct 19, 2026 at 02:37 AM +0800
 
 GBT=0
 
@@ -64,9 +64,7 @@ case $1 in
             [5]=0
         )
 
-        for bus in ${I2C_BUS[@]}; do
-            ./saltutil.py $bus init -g $GBT
-        done
+        ./saltutil.py $(IFS=,; echo "${I2C_BUS[*]}") init -g $GBT || exit 1
 
         # Now we start adjusting phase
         test_dcb ${GBTXS[@]} ${I2C_BUS[@]}
@@ -82,14 +80,16 @@ case $1 in
             [6]=5
         )
 
-        for bus in ${I2C_BUS[@]}; do
-            ./saltutil.py $bus init -g $GBT
-        done
+        ./saltutil.py $(IFS=,; echo "${I2C_BUS[*]}") init -g $GBT || exit 1
 
         # Now we start adjusting phase
         test_dcb ${GBTXS[@]} ${I2C_BUS[@]}
         ;;
 
+    SWEEP) # Overview of all MiniDAQ channels connected to slave GBTxs
+        ./memmon.py --sweep ${MINIDAQ_CHS[@]} -n 4 -s c4
+        ;;
+
     *)
         echo "Unknown option: $1."
         ;;
@@ -2,13 +2,15 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Mon Dec 30, 2019 at 12:27 AM -0500
+# Last Change: Mon Oct 19, 2026 at 02:10 AM +0800
 
 import sys
 
 from argparse import ArgumentParser
 
 from nanoDAQ.ut.dcb import DCB
+from nanoDAQ.prbs import prbs_check_fibers, prbs_tabulate
+from nanoDAQ.ut.shadow import shadow_from_args
 from nanoDAQ.utils import add_default_subparser, HexToIntAction
 
 
@@ -41,6 +43,17 @@ initialize specified slave GBTxs with a configuration file.
                           help='''
 path to GBTx config file.
     ''')
+    init_cmd.add_argument('--diff',
+                          action='store_true',
+                          help='''
+read back current registers and only write the ones that differ.
+    ''')
+    init_cmd.add_argument('--max-gap',
+                          type=int,
+                          default=4,
+                          help='''
+merge differing register ranges separated by up to this many registers.
+    ''')
 
     gpio_cmd = add_dcb_default_subparser(cmd, 'gpio', description='''
 GPIO status and reset.
@@ -59,14 +72,34 @@ specify GPIO lines to reset. default to print out current value of GPIO 0-6.
                           default='high',
                           help='''
 specify the final state after pulling GPIO to low.''')
+    gpio_cmd.add_argument('--pulse-width',
+                          type=float,
+                          default=1,
+                          help='''
+specify how long the GPIO lines are held low, in seconds.''')
 
     prbs_cmd = add_dcb_default_subparser(cmd, 'prbs', description='''
 control PRBS register.
 ''')
     prbs_cmd.add_argument('mode',
+                          nargs='?',
+                          default=None,
                           help='''
 specify the PRBS register value. supported shortcuts: {}.
     ''')
+    prbs_cmd.add_argument('--check',
+                          nargs='+',
+                          type=int,
+                          default=None,
+                          help='''
+check PRBS7 data of the slaves on these MiniDAQ channels, one per slave.
+    ''')
+    prbs_cmd.add_argument('-n', '--num',
+                          type=int,
+                          default=4,
+                          help='''
+specify number of 256-frames to check per MiniDAQ channel.
+    ''')
 
     write_cmd = add_dcb_default_subparser(cmd, 'write', description='''
 specify GBTx register address and value to write.
@@ -109,16 +142,22 @@ reset slave GBTxs.
                            default='high',
                            help='''
 specify the final state after pulling GPIO to low.''')
+    reset_cmd.add_argument('--pulse-width',
+                           type=float,
+                           default=1,
+                           help='''
+specify how long the GPIO line is held low, in seconds.''')
 
     bias_cur_cmd = add_dcb_default_subparser(cmd, 'bias_cur', description='''
 read and configure bias current of VTXx modules.
 ''')
     bias_cur_cmd.add_argument('cur',
-                              nargs='?',
+                              nargs='*',
                               type=float,
                               default=None,
                               help='''
-specify bias current, in mA.
+specify bias current, in mA. if multiple currents are given, set them in turn
+and tabulate the readback.
     ''')
 
     elk_phase_cmd = add_dcb_default_subparser(cmd, 'elk_phase', description='''
@@ -137,6 +176,22 @@ specify elink channel (0-13).
 specify elink phase.
     ''')
 
+    elk_phases_cmd = add_dcb_default_subparser(cmd, 'elk_phases', description='''
+specify a phase of multiple elinks at once.
+''')
+    elk_phases_cmd.add_argument('phase',
+                                help='''
+specify elink phase.
+    ''')
+
+    elk_phases_cmd.add_argument('-e', '--elinks',
+                                nargs='+',
+                                type=int,
+                                default=list(range(14)),
+                                help='''
+specify elink channels (0-13). default to all.
+    ''')
+
     return parser
 
 
@@ -145,40 +200,65 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     if args.cmd:
-        dcb = DCB(args.gbt)
+        shadow = shadow_from_args(args)
+        dcb = DCB(args.gbt, shadow=shadow)
     else:
         parser.print_help()
         sys.exit(1)
 
-    if args.cmd == 'init':
-        dcb.init(args.filepath, args.slaves)
-
-    elif args.cmd == 'gpio':
-        if args.reset is not None:
-            dcb.gpio_reset(args.reset, args.final_state)
-        else:
-            dcb.gpio_status()
-
-    elif args.cmd == 'prbs':
-        dcb.prbs(args.mode, args.slaves)
-
-    elif args.cmd == 'status':
-        dcb.slave_status(args.slaves)
-
-    elif args.cmd == 'write':
-        dcb.write(args.reg, args.val, args.slaves)
-
-    elif args.cmd == 'read':
-        dcb.read(args.reg, args.size, args.slaves)
-
-    elif args.cmd == 'reset':
-        dcb.reset(args.final_state)
-
-    elif args.cmd == 'bias_cur':
-        if args.cur is not None:
-            dcb.bias_cur_set(args.cur, args.slaves)
-        else:
-            dcb.bias_cur_status(args.slaves)
-
-    elif args.cmd == 'elk_phase':
-        dcb.elink_phase(args.channel, args.phase, args.slaves)
+    # Also save what was forgotten when a write fails halfway.
+    try:
+        if args.cmd == 'init':
+            dcb.init(args.filepath, args.slaves, args.diff, args.max_gap)
+
+        elif args.cmd == 'gpio':
+            if args.reset is not None:
+                dcb.gpio_reset(args.reset, args.final_state, args.pulse_width)
+            else:
+                dcb.gpio_status()
+
+        elif args.cmd == 'prbs':
+            if args.mode is None and args.check is None:
+                parser.error('specify a PRBS mode, --check, or both.')
+            if args.mode is not None:
+                dcb.prbs(args.mode, args.slaves)
+
+            if args.check is not None:
+                slaves = dcb.dyn_slaves(args.slaves)
+                if len(slaves) != len(args.check):
+                    parser.error('--check needs one MiniDAQ channel per slave.')
+
+                checkers = prbs_check_fibers(args.check, args.num)
+                print(prbs_tabulate(
+                    [row for s, f in zip(slaves, args.check)
+                     for row in checkers[f].report(False, [s, f])],
+                    prefix=['slave', 'channel']))
+
+        elif args.cmd == 'status':
+            dcb.slave_status(args.slaves)
+
+        elif args.cmd == 'write':
+            dcb.write(args.reg, args.val, args.slaves)
+
+        elif args.cmd == 'read':
+            dcb.read(args.reg, args.size, args.slaves)
+
+        elif args.cmd == 'reset':
+            dcb.reset(args.final_state, args.pulse_width)
+
+        elif args.cmd == 'bias_cur':
+            if len(args.cur) > 1:
+                dcb.bias_cur_sweep(args.cur, args.slaves)
+            elif args.cur:
+                dcb.bias_cur_set(args.cur[0], args.slaves)
+            else:
+                dcb.bias_cur_status(args.slaves)
+
+        elif args.cmd == 'elk_phase':
+            dcb.elink_phase(args.channel, args.phase, args.slaves)
+
+        elif args.cmd == 'elk_phases':
+            dcb.elink_phases({ch: args.phase for ch in args.elinks}, args.slaves)
+
+    finally:
+        shadow.save()
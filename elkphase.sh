@@ -2,11 +2,9 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Fri Jan 17, 2020 at 01:51 AM -0500
+# Last Change: Sun Oct 18, 2026 at 03:26 PM +0800
 
 PHASE=$1
 
-for elk_channel in 11 10 9 8 7 6 5 4 3 2 1; do
-    # NOTE: "${@:2}" pass-thru all arguments except the first
-    ./dcbutil.py elk_phase ${elk_channel} ${PHASE} "${@:2}"
-done
+# NOTE: "${@:2}" pass-thru all arguments except the first
+./dcbutil.py elk_phases ${PHASE} -e 11 10 9 8 7 6 5 4 3 2 1 "${@:2}"
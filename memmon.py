@@ -2,18 +2,30 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Mon Jan 06, 2020 at 01:56 AM -0500
+# Last Change: Mon Oct 19, 2026 at 01:41 AM +0800
+
+import sys
 
 from argparse import ArgumentParser
+from collections import deque
+from datetime import datetime
+from tabulate import tabulate
+from time import sleep, time
 
 from nanoDAQ.gbtclient.fpga_reg import mem_mon_read_safe
 from nanoDAQ.gbtclient.fpga_reg import mem_mon_fiber_read_safe, \
     mem_mon_fiber_write_safe
 from nanoDAQ.gbtclient.fpga_reg import mem_mon_options_read_safe, \
     mem_mon_options_write_safe
+from nanoDAQ.gbtclient.fpga_reg import mem_mon_sweep_safe, fiber_index
+from nanoDAQ.capture import CaptureWriter, CaptureReader
+from nanoDAQ.elink import ElinkFrameBatch, ElinkFrameRing
+from nanoDAQ.quality import LinkQuality
+from nanoDAQ.prbs import PRBSChecker
 from nanoDAQ.elink import print_elink_table, highlight_search_pattern, \
-    highlight_non_mode
-from nanoDAQ.utils import HexToIntAction
+    highlight_non_mode, elink_anomalies, format_elink_table, transpose
+from nanoDAQ.elink import print_sweep_table
+from nanoDAQ.utils import HexToIntAction, hex_pad
 
 
 ################################
@@ -48,6 +60,82 @@ specify number of 256-frames to obtain.
                         default=None,
                         help='''
 specify elink channel to read.
+''')
+
+    parser.add_argument('-f', '--follow',
+                        action='store_true',
+                        help='''
+keep reading, and refresh a summary in place.
+''')
+
+    parser.add_argument('--rate',
+                        type=float,
+                        default=2,
+                        help='''
+specify refresh rate of --follow, in Hz.
+''')
+
+    parser.add_argument('--depth',
+                        type=int,
+                        default=4096,
+                        help='''
+specify number of most recent frames summarized by --follow.
+''')
+
+    parser.add_argument('--anomalies',
+                        type=int,
+                        default=5,
+                        help='''
+specify number of most recent anomalous frames shown by --follow.
+''')
+
+    parser.add_argument('-q', '--quality',
+                        action='store_true',
+                        help='''
+accumulate link quality statistics of all frames read against the -s pattern
+(default to c4), and print them at the end, or with --follow.
+''')
+
+    parser.add_argument('--header',
+                        action=HexToIntAction,
+                        default=None,
+                        help='''
+specify expected frame header for -q. default to the most common header of the
+first read.
+''')
+
+    parser.add_argument('--sweep',
+                        nargs='+',
+                        type=int,
+                        default=None,
+                        help='''
+read -n 256-frames of each of these MiniDAQ channels, and print an overview
+with one line per channel.
+''')
+
+    parser.add_argument('-p', '--prbs',
+                        action='store_true',
+                        help='''
+check that elinks carry PRBS7 data, and print bit error rates at the end, or
+with --follow.
+''')
+
+    parser.add_argument('--save',
+                        default=None,
+                        help='''
+append the frames read to a capture file.
+''')
+
+    parser.add_argument('--compress',
+                        action='store_true',
+                        help='''
+compress the frames saved by --save.
+''')
+
+    parser.add_argument('--replay',
+                        default=None,
+                        help='''
+read frames from a capture file instead of the memory monitoring.
 ''')
 
     return parser
@@ -58,22 +146,186 @@ specify elink channel to read.
 ###########
 
 read    = mem_mon_read_safe
+sweep   = mem_mon_sweep_safe
 fiber_r = mem_mon_fiber_read_safe
 fiber_w = mem_mon_fiber_write_safe
 opts_r  = mem_mon_options_read_safe
 opts_w  = mem_mon_options_write_safe
 
 
+###########
+# Capture #
+###########
+
+def current_fiber():
+    return fiber_index(fiber_r())
+
+
+# Return a function that reads a batch, and saves it along the way if needed.
+def reader(capture=None, fiber=None):
+    if capture is None:
+        return read
+
+    opts = bytes.fromhex(opts_r())
+    fiber = current_fiber() if fiber is None else fiber
+
+    def read_and_save():
+        batch = read()
+        capture.write(batch, fiber=fiber, opts=opts)
+        capture.flush()
+        return batch
+
+    return read_and_save
+
+
+# Return a function that replays a capture block by block, and None when the
+# capture is exhausted.
+def replayer(capture, fiber=None):
+    blocks = capture.blocks(fiber)
+    return lambda: next(blocks, (None, None))[1]
+
+
+###############
+# Follow mode #
+###############
+
+def format_summary(ring, expected=None):
+    stats = ring.batch().stats()
+    # tx_datavalid and header are always compared to their modes
+    ref = stats.mode.copy()
+    if expected is not None:
+        ref[2:] = expected
+    mismatch = len(ring) - stats.hist[range(len(ref)), ref]
+
+    return [[k, hex_pad(int(m)), int(c), '{:.2%}'.format(c / len(ring))]
+            for k, m, c in zip(ElinkFrameBatch.fields, stats.mode, mismatch)]
+
+
+# 'accumulators' are updated with every batch read, and their reports are
+# refreshed together with the summary.
+def draw(ring, anomalies, expected=None, accumulators=[], clear=''):
+    print(clear + 'Frames read: {}, summarizing last {}.\n'.format(
+        ring.total, len(ring)))
+    print(tabulate(format_summary(ring, expected),
+                   headers=['field', 'mode', 'mismatch', 'fraction'],
+                   colalign=['left', 'right', 'right', 'right']))
+
+    if anomalies:
+        times, frames = zip(*anomalies)
+        rows = format_elink_table(
+            {k: list(map(hex_pad, v)) for k, v in
+             transpose(ElinkFrameBatch.from_frames(frames)).items()},
+            range(len(frames)))
+        print('\nLast anomalies:')
+        print(tabulate([[t] + r for t, r in zip(times, rows)],
+                       headers=['time', 'tx_datavalid', 'header',
+                                '13-12', '11-8', '7-4', '3-0'],
+                       colalign=['left']+['right']*6))
+
+    for acc in accumulators:
+        print()
+        acc.report()
+
+    sys.stdout.flush()
+
+
+# Read as fast as possible, so that 'accumulators' see every frame, and only
+# redraw at 'rate'. If 'paced' (e.g. replaying a capture), a single batch is
+# read per redraw instead.
+def follow(depth, rate, num_of_anomalies, expected=None, read=read,
+           accumulators=[], paced=False):
+    ring = ElinkFrameRing(depth)
+    anomalies = deque(maxlen=num_of_anomalies)
+    clear = '\033[H\033[J' if sys.stdout.isatty() else ''
+    last_draw = 0
+
+    while True:
+        batch = read()
+        if batch is None:
+            if ring.total:
+                draw(ring, anomalies, expected, accumulators, clear)
+            break
+
+        ring.append(batch)
+        for acc in accumulators:
+            acc.update(batch)
+
+        modes = ring.batch().stats().mode
+        idx = elink_anomalies(batch, modes)[-num_of_anomalies:]
+        stamp = datetime.now().strftime('%H:%M:%S')
+        anomalies.extend(zip([stamp]*len(idx), batch[idx].to_frames()))
+
+        if paced or time() - last_draw >= 1/rate:
+            draw(ring, anomalies, expected, accumulators, clear)
+            if paced:
+                sleep(max(0, 1/rate - (time() - last_draw)))
+            last_draw = time()
+
+
 if __name__ == '__main__':
     parser = parse_input()
     args = parser.parse_args()
 
-    if args.channel:
-        fiber_w(args.channel)
+    if args.sweep:
+        batches = sweep(args.sweep, args.num, concat=False)
+
+        if args.save:
+            opts = bytes.fromhex(opts_r())
+            with CaptureWriter(args.save, args.compress) as capture:
+                for fiber, lst in batches.items():
+                    for batch in lst:
+                        capture.write(batch, fiber=fiber, opts=opts)
+
+        print_sweep_table({f: ElinkFrameBatch.concat(lst)
+                           for f, lst in batches.items()}, args.search)
+        sys.exit(0)
+
+    if args.replay:
+        capture = CaptureReader(args.replay)
+        source = replayer(capture, args.channel)
+    else:
+        if args.channel:
+            fiber_w(args.channel)
+        capture = CaptureWriter(args.save, args.compress) if args.save \
+            else None
+        source = reader(capture, args.channel)
+
+    accumulators = []
+    if args.quality:
+        accumulators.append(
+            LinkQuality(0xc4 if args.search is None else args.search,
+                        header=args.header))
+    if args.prbs:
+        accumulators.append(PRBSChecker())
+
+    if args.follow:
+        try:
+            follow(args.depth, args.rate, args.anomalies, args.search, source,
+                   accumulators, paced=bool(args.replay))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if accumulators:
+        # Use timestamps of the capture, so that error times are those of the
+        # run.
+        if args.replay:
+            blocks = capture.blocks(args.channel)
+        else:
+            blocks = ((None, source()) for _ in range(args.num))
+
+        for block, batch in blocks:
+            for acc in accumulators:
+                acc.update(batch, None if block is None else block.timestamp)
+
+        for i, acc in enumerate(accumulators):
+            if i:
+                print()
+            acc.report()
+        sys.exit(0)
 
-    readout = []
-    for i in range(args.num):
-        readout += read()
+    readout = ElinkFrameBatch.concat(
+        [b for b in (source() for _ in range(args.num)) if b is not None])
 
     if args.search:
         highlighter = lambda x, y, z: highlight_search_pattern(x, args.search)
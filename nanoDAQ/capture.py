@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+#
+# Author: Yipeng Sun
+# License: BSD 2-clause
+# Last Change: Sun Oct 18, 2026 at 09:48 PM +0800
+#
+# An append-only binary format for memory monitoring captures:
+#
+#   file header | block header | frames | block header | frames | ...
+#
+# Each block holds the raw 16-byte frames of a single read, optionally zlib
+# compressed, together with the fiber, TELL40, monitoring options, a
+# timestamp, and a user tag (e.g. the phase being scanned).
+
+import mmap
+import os.path as op
+import struct
+import zlib
+
+from collections import namedtuple
+from time import time
+
+from nanoDAQ.gbtclient.common import TELL40
+from nanoDAQ.elink import ElinkFrameBatch, ELINK_FRAME_SIZE
+from nanoDAQ.elink import elink_extract_chs
+from nanoDAQ.exceptions import CaptureError
+
+
+#############
+# Constants #
+#############
+
+CAPTURE_MAGIC = b'NANODAQ\0'
+CAPTURE_VERSION = 1
+
+# magic, version, frame size
+FILE_HEADER = struct.Struct('<8sHH4x')
+
+# magic, fiber, flags, TELL40, options, timestamp, tag, frames, payload size
+BLOCK_HEADER = struct.Struct('<4shBx32s4sdIII')
+BLOCK_MAGIC = b'BLK\0'
+
+FLAG_ZLIB = 0x1
+
+CaptureBlock = namedtuple('CaptureBlock', ['offset', 'fiber', 'tell40',
+                                           'opts', 'timestamp', 'tag',
+                                           'nframes', 'flags', 'size'])
+
+
+##########
+# Writer #
+##########
+
+class CaptureWriter(object):
+    def __init__(self, filepath, compress=False):
+        self.compress = compress
+
+        new = not op.isfile(filepath) or op.getsize(filepath) == 0
+        self.f = open(filepath, 'ab')
+        if new:
+            self.f.write(FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION,
+                                          ELINK_FRAME_SIZE))
+
+    def write(self, batch, fiber=None, tell40=TELL40, opts=b'', tag=0,
+              timestamp=None):
+        payload = batch.to_buffer()
+        flags = 0
+
+        if self.compress:
+            payload = zlib.compress(payload)
+            flags |= FLAG_ZLIB
+
+        self.f.write(BLOCK_HEADER.pack(
+            BLOCK_MAGIC, -1 if fiber is None else fiber, flags,
+            tell40.encode(), bytes(opts)[:4],
+            time() if timestamp is None else timestamp,
+            tag, len(batch), len(payload)))
+        self.f.write(payload)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+##########
+# Reader #
+##########
+
+# Opening a capture only maps it; blocks are located lazily, and frames are
+# only decoded when asked for.
+class CaptureReader(object):
+    def __init__(self, filepath):
+        self.f = open(filepath, 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index = None
+
+        if len(self.mm) < FILE_HEADER.size:
+            raise CaptureError('{} is too short.'.format(filepath))
+
+        magic, version, frame_size = FILE_HEADER.unpack_from(self.mm, 0)
+        if magic != CAPTURE_MAGIC or frame_size != ELINK_FRAME_SIZE:
+            raise CaptureError('{} is not a capture.'.format(filepath))
+        if version > CAPTURE_VERSION:
+            raise CaptureError('Unsupported capture version {}.'.format(
+                version))
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def headers(self):
+        offset = FILE_HEADER.size
+
+        while offset + BLOCK_HEADER.size <= len(self.mm):
+            magic, fiber, flags, tell40, opts, timestamp, tag, nframes, \
+                size = BLOCK_HEADER.unpack_from(self.mm, offset)
+            if magic != BLOCK_MAGIC:
+                raise CaptureError('Corrupted block at {}.'.format(offset))
+
+            payload = offset + BLOCK_HEADER.size
+            # A block being appended right now
+            if payload + size > len(self.mm):
+                break
+
+            yield CaptureBlock(payload, fiber, tell40.rstrip(b'\0').decode(),
+                               opts, timestamp, tag, nframes, flags, size)
+            offset = payload + size
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = list(self.headers())
+        return self._index
+
+    def __len__(self):
+        return len(self.index)
+
+    def decode(self, block):
+        if block.flags & FLAG_ZLIB:
+            payload = zlib.decompress(
+                self.mm[block.offset:block.offset+block.size])
+        else:
+            payload = memoryview(self.mm)[block.offset:
+                                          block.offset+block.size]
+        return ElinkFrameBatch.from_buffer(payload)
+
+    def blocks(self, fiber=None, tag=None):
+        for block in self.headers():
+            if (fiber is None or block.fiber == fiber) and \
+                    (tag is None or block.tag == tag):
+                yield block, self.decode(block)
+
+    def batch(self, fiber=None, tag=None):
+        return ElinkFrameBatch.concat(
+            [b for _, b in self.blocks(fiber, tag)])
+
+    def tags(self):
+        return sorted({b.tag for b in self.index})
+
+
+##########################
+# Offline phase scanning #
+##########################
+
+# Rebuild the output of 'nanoDAQ.phase.loop_phase_elk' from a capture with
+# blocks tagged by phases.
+def capture_loop_result(reader, daq_chs, fiber=None):
+    return {hex(tag)[2:]: elink_extract_chs(reader.batch(fiber, tag), daq_chs)
+            for tag in reader.tags()}
@@ -2,15 +2,17 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Mon Jan 06, 2020 at 02:08 AM -0500
+# Last Change: Mon Oct 19, 2026 at 01:33 AM +0800
 
 import sys
+import numpy as np
 
 from collections import namedtuple
+from functools import lru_cache
 from tabulate import tabulate
 from sty import fg
 
-from nanoDAQ.utils import hex_pad, num_of_bit, bit_shift, most_common
+from nanoDAQ.utils import hex_pad, num_of_bit, bit_shift
 
 
 ################
@@ -41,6 +43,171 @@ def elink_parser(df):
                           *elk_11_8, *elk_7_4, *elk_3_0)
 
 
+# Byte index in a frame for each field of 'ElinkDataFrame', in order.
+ELINK_FRAME_SIZE = 16
+ELINK_FIELD_INDEX = np.array(elink_parser(range(ELINK_FRAME_SIZE)))
+
+
+# Decode a memory monitoring dump into a (16, N) array, with one row per field
+# of 'ElinkDataFrame'. A trailing partial frame is dropped.
+def elink_decode(buf):
+    mem = np.frombuffer(buf, dtype=np.uint8)
+    frames = mem[:mem.size // ELINK_FRAME_SIZE * ELINK_FRAME_SIZE].reshape(
+        -1, ELINK_FRAME_SIZE)
+    return np.ascontiguousarray(frames[:, ELINK_FIELD_INDEX].T)
+
+
+##########################
+# Columnar elink batches #
+##########################
+
+# A batch of elink data frames, stored as a (16, N) uint8 array with one
+# contiguous row per field of 'ElinkDataFrame'. Indexing with an int gives a
+# 'ElinkDataFrame', so it can stand in for a list of frames.
+class ElinkFrameBatch(object):
+    fields = ElinkDataFrame._fields
+    field_index = {k: i for i, k in enumerate(ElinkDataFrame._fields)}
+
+    def __init__(self, data=None):
+        if data is None:
+            data = np.empty((len(self.fields), 0), dtype=np.uint8)
+        self.data = np.ascontiguousarray(data, dtype=np.uint8)
+
+    @classmethod
+    def from_buffer(cls, buf):
+        return cls(elink_decode(buf))
+
+    @classmethod
+    def from_frames(cls, frames):
+        data = np.array(frames, dtype=np.uint8).reshape(-1, len(cls.fields))
+        return cls(data.T)
+
+    @classmethod
+    def concat(cls, batches):
+        batches = [b if isinstance(b, cls) else cls.from_frames(b)
+                   for b in batches]
+        if not batches:
+            return cls()
+        return cls(np.concatenate([b.data for b in batches], axis=1))
+
+    def to_frames(self):
+        return [ElinkDataFrame(*f) for f in self.data.T.tolist()]
+
+    # Inverse of 'from_buffer': Frames in the memory monitoring byte order.
+    def to_buffer(self):
+        frames = np.empty((len(self), ELINK_FRAME_SIZE), dtype=np.uint8)
+        frames[:, ELINK_FIELD_INDEX] = self.data.T
+        return frames.tobytes()
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return ElinkDataFrame(*self.data[:, key].tolist())
+        return type(self)(self.data[:, key])
+
+    def __iter__(self):
+        return iter(self.to_frames())
+
+    def __add__(self, other):
+        return self.concat([self, other])
+
+    def field(self, name):
+        return self.data[self.field_index[name]]
+
+    def elk(self, ch):
+        return self.field('elk'+str(ch))
+
+    def chs(self, chs):
+        return {ch: self.elk(ch) for ch in chs}
+
+    def columns(self):
+        return {k: self.data[i] for i, k in enumerate(self.fields)}
+
+    def stats(self, expected=None):
+        return elink_stats(self.data, expected)
+
+
+# Keep the last 'depth' frames in a preallocated buffer.
+class ElinkFrameRing(object):
+    def __init__(self, depth):
+        self.depth = depth
+        self.data = np.zeros((len(ElinkFrameBatch.fields), depth),
+                             dtype=np.uint8)
+        self.pos = 0
+        self.size = 0
+        self.total = 0
+
+    def append(self, batch):
+        data = batch.data[:, -self.depth:]
+        n = data.shape[1]
+        head = min(n, self.depth - self.pos)
+
+        self.data[:, self.pos:self.pos+head] = data[:, :head]
+        self.data[:, :n-head] = data[:, head:]
+
+        self.pos = (self.pos + n) % self.depth
+        self.size = min(self.size + n, self.depth)
+        self.total += len(batch)
+
+    def batch(self):
+        if self.size < self.depth:
+            return ElinkFrameBatch(self.data[:, :self.size])
+        return ElinkFrameBatch(np.concatenate(
+            [self.data[:, self.pos:], self.data[:, :self.pos]], axis=1))
+
+    def __len__(self):
+        return self.size
+
+
+# Indices of frames with any field that differs from 'modes'.
+def elink_anomalies(batch, modes):
+    modes = np.asarray(modes, dtype=np.uint8)[:, None]
+    return np.nonzero((batch.data != modes).any(axis=0))[0]
+
+
+####################
+# Elink statistics #
+####################
+
+ElinkStats = namedtuple('ElinkStats', ['mode', 'freq', 'hist', 'match'])
+
+
+# Histogram each row of a (K, N) uint8 array (or a single row) in one
+# 'bincount'. For each row, return the most common value, its frequency, the
+# 256-bin histogram, and the fraction of values equal to 'expected'. Ties go
+# to the value that appears first, as with 'nanoDAQ.utils.most_common'.
+def elink_stats(data, expected=None):
+    data = np.atleast_2d(np.asarray(data, dtype=np.uint8))
+    rows, size = data.shape
+
+    offsets = np.arange(rows, dtype=np.intp)[:, None] * 256
+    hist = np.bincount((data + offsets).ravel(),
+                       minlength=rows*256).reshape(rows, 256)
+
+    idx = np.arange(rows)
+    if size:
+        tied = hist == hist.max(axis=1, keepdims=True)
+        first = tied[idx[:, None], data].argmax(axis=1)
+        mode = data[idx, first].astype(np.intp)
+    else:
+        mode = np.zeros(rows, dtype=np.intp)
+    freq = hist[idx, mode]
+    match = None
+    if expected is not None:
+        match = hist[:, expected] / size if size else np.zeros(rows)
+
+    return ElinkStats(mode, freq, hist, match)
+
+
+# Same as 'elink_stats', but for a {channel: data} map.
+def elink_stats_chs(chs_data, expected=None):
+    chs = list(chs_data)
+    stats = elink_stats(np.stack([chs_data[ch] for ch in chs]), expected)
+    return chs, stats
+
+
 #######################
 # Elink data checkers #
 #######################
@@ -49,16 +216,31 @@ def check_tx_datavalid(data):
     return 1 if 0x80 == data else 0
 
 
+# For every possible DATA, the smallest shift that rotates it to 'expected',
+# or -1.
+@lru_cache(maxsize=64)
+def bit_shift_lut(expected, size=8):
+    lut = np.full(1 << size, -1, dtype=np.int8)
+
+    # Rotating DATA left by 'shift' gives 'expected', iff DATA is 'expected'
+    # rotated left by 'size - shift'. Smaller shifts are written last.
+    for shift in reversed(range(size)):
+        lut[bit_shift(expected, size - shift, size)] = shift
+
+    lut.flags.writeable = False
+    return lut
+
+
+# Works on a single value, or on a whole array of them.
 def check_bit_shift(data, expected=0xc4):
     size = num_of_bit(hex_pad(expected))
+    lut = bit_shift_lut(expected, size)
 
-    for shift in range(size):
-        # We choose to shift DATA (This is chosen to make manipulating OUR
-        # hardware more easily).
-        if bit_shift(data, shift, size) == expected:
-            return shift
-
-    return -1
+    # We choose to shift DATA (This is chosen to make manipulating OUR
+    # hardware more easily).
+    if np.ndim(data):
+        return lut[np.asarray(data)]
+    return int(lut[data]) if 0 <= data < lut.size else -1
 
 
 #############################
@@ -95,6 +277,9 @@ def highlight_search_pattern(data, pattern):
 ################
 
 def transpose(elk_df_lst):
+    if isinstance(elk_df_lst, ElinkFrameBatch):
+        return {k: v.tolist() for k, v in elk_df_lst.columns().items()}
+
     return {k: [getattr(d, k) for d in elk_df_lst]
             for k in ElinkDataFrame._fields}
 
@@ -127,6 +312,9 @@ def print_elink_table(elk_df_lst,
     indices = []
     size = len(elk_df_lst)
 
+    if not isinstance(elk_df_lst, ElinkFrameBatch):
+        elk_df_lst = ElinkFrameBatch.from_frames(elk_df_lst)
+
     # Transpose elink data frames to each elink channel
     elk_df_lst_t = transpose(elk_df_lst)
     # For pipe output
@@ -134,7 +322,8 @@ def print_elink_table(elk_df_lst,
                        for k, v in elk_df_lst_t.items()}
 
     # Find the mode for each field
-    modes = {k: most_common(v)[0] for k, v in elk_df_lst_t.items()}
+    modes = dict(zip(ElinkFrameBatch.fields,
+                     elk_df_lst.stats().mode.tolist()))
 
     # Apply highlight and matching
     for k, v in elk_df_lst_t.items():
@@ -166,11 +355,49 @@ def print_elink_table(elk_df_lst,
         print('No highlighted row!')
 
 
+# One row per fiber of a {fiber: batch} map, with the mode of each field, and
+# the fraction of frames with any elink differing from 'expected' (or from its
+# mode).
+def format_sweep_table(batches, expected=None):
+    result = []
+
+    for fiber, batch in batches.items():
+        if not len(batch):
+            result.append([fiber, 0] + ['']*7)
+            continue
+
+        modes = batch.stats().mode
+        # tx_datavalid and header are always compared to their modes
+        ref = modes.copy()
+        if expected is not None:
+            ref[2:] = expected
+        bad = elink_anomalies(batch, ref)
+        modes_t = {k: [hex_pad(int(m))]
+                   for k, m in zip(ElinkFrameBatch.fields, modes)}
+
+        result.append([fiber, len(batch)] +
+                      format_elink_table(modes_t, [0])[0] +
+                      ['{:.2%}'.format(len(bad) / len(batch))])
+
+    return result
+
+
+def print_sweep_table(batches, expected=None):
+    print(tabulate(format_sweep_table(batches, expected),
+                   headers=['channel', 'frames', 'tx_datavalid', 'header',
+                            '13-12', '11-8', '7-4', '3-0', 'anomalies'],
+                   colalign=['left']+['right']*8,
+                   disable_numparse=True))
+
+
 #########################
 # Elink data operations #
 #########################
 
 def elink_extract(elk_df_lst, names):
+    if isinstance(elk_df_lst, ElinkFrameBatch):
+        return {n: elk_df_lst.field(n) for n in names}
+
     result = {k: [] for k in names}
 
     for elk_df in elk_df_lst:
@@ -2,7 +2,7 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Mon Dec 16, 2019 at 02:50 AM -0500
+# Last Change: Sun Oct 18, 2026 at 09:48 PM +0800
 
 
 class DIMError(Exception):
@@ -31,3 +31,7 @@ class SALTError(Exception):
 
 class ExecError(Exception):
     pass
+
+
+class CaptureError(Exception):
+    pass
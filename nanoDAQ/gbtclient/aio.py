@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+#
+# Author: Yipeng Sun
+# License: BSD 2-clause
+# Last Change: Mon Oct 19, 2026 at 03:05 AM +0800
+#
+# asyncio flavors of the I2C, GPIO and memory monitoring operations. Each one
+# runs its synchronous counterpart in the default executor, so operations on
+# different command services are in flight at the same time, while the ones
+# sharing a command service take turns with each other and with threads using
+# the synchronous API, see 'nanoDAQ.gbtclient.transport.cmnd_lock'.
+
+import asyncio
+
+from functools import partial, wraps
+
+from nanoDAQ.gbtclient import i2c, gpio, fpga_reg
+
+
+def run_in_executor(f):
+    @wraps(f)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(f, *args, **kwargs))
+
+    return wrapper
+
+
+##################
+# I2C Operations #
+##################
+
+i2c_write = run_in_executor(i2c.i2c_write)
+i2c_read = run_in_executor(i2c.i2c_read)
+i2c_writeread = run_in_executor(i2c.i2c_writeread)
+i2c_activate_ch = run_in_executor(i2c.i2c_activate_ch)
+
+
+###################
+# GPIO Operations #
+###################
+
+gpio_write = run_in_executor(gpio.gpio_write)
+gpio_read = run_in_executor(gpio.gpio_read)
+gpio_activate_ch = run_in_executor(gpio.gpio_activate_ch)
+gpio_setdir = run_in_executor(gpio.gpio_setdir)
+gpio_setline = run_in_executor(gpio.gpio_setline)
+gpio_getdir = run_in_executor(gpio.gpio_getdir)
+gpio_getline = run_in_executor(gpio.gpio_getline)
+
+
+#####################
+# Memory monitoring #
+#####################
+
+mem_mon_read = run_in_executor(fpga_reg.mem_mon_request)
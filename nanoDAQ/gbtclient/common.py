@@ -2,11 +2,10 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Mon Jun 29, 2020 at 08:26 PM +0800
+# Last Change: Mon Oct 19, 2026 at 03:31 AM +0800
 
 from platform import node
 
-from nanoDAQ.utils import hex_rep, dict_factory
 from nanoDAQ.exceptions import DIMError, GBTError
 
 
@@ -18,6 +17,8 @@ GBT_PREF = 'Gbt'
 GBT_SERV = node()  # Canonical hostname
 TELL40   = 'TELL40_Dev1_0'
 
+DIM_TIMEOUT = 5  # in seconds
+
 # This is defined in 'gbt_sca/inc/constants.h'
 SCA_OP_MODE = {
     'write':         0,
@@ -53,19 +54,38 @@ def hex_to_bytes(val):
     return bytes.fromhex(val)
 
 
+# Accept register values either as raw bytes or as hex strings.
+def to_bytes(val):
+    if isinstance(val, (bytes, bytearray, memoryview)):
+        return bytes(val)
+    return hex_to_bytes(val)
+
+
+# pydim hands 'C' items back as str, with one char per byte.
+def dim_bytes(val):
+    if isinstance(val, str):
+        return val.encode('latin-1')
+    return bytes(val)
+
+
+def dim_str(val):
+    return dim_bytes(val).decode('latin-1')
+
+
 def str_to_hex(val):
     if isinstance(val, int):
         return val
-    elif isinstance(val, bytes):
-        return hex_rep([int(c) for c in val])
-    else:
-        return hex_rep([int('{:2x}'.format(ord(c)), base=16) for c in val])
+    return dim_bytes(val).hex()
 
 
 def default_dim_regulator(tp):
     return [str_to_hex(e) for e in tp]
 
 
+def bytes_regulator(tp):
+    return [e if isinstance(e, int) else dim_bytes(e) for e in tp]
+
+
 ###############################
 # Return value error handling #
 ###############################
@@ -91,3 +111,11 @@ def dim_dic_err(ret, errs, expected=0):
 
     else:
         return result
+
+
+#################
+# Service names #
+#################
+
+def fpga_srvc(kind, reg, tell40=TELL40):
+    return '{}/{}.{}'.format(kind, tell40, reg)
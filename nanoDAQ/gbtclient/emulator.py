@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+#
+# Author: Yipeng Sun
+# License: BSD 2-clause
+# Last Change: Mon Oct 19, 2026 at 03:31 AM +0800
+#
+# An in-process stand-in for gbtserv. It speaks the same 'Gbt/<host>/Cmnd*'
+# and 'Gbt/<host>/Srvc*' services, and exposes them through a pydim-shaped
+# interface, so that it can be used as a drop-in DIM transport.
+
+from collections import defaultdict
+from itertools import count
+from threading import RLock
+from time import sleep
+
+from nanoDAQ.gbtclient.common import GBT_PREF, GBT_SERV, SCA_OP_MODE
+from nanoDAQ.gbtclient.common import dim_bytes, dim_str
+from nanoDAQ.gbtclient.gpio import GPIO_REG
+from nanoDAQ.ut.dcb import GBTX_STATUS_REG, GBTX_IDLE
+
+
+#############
+# Constants #
+#############
+
+# Same error codes as gbtserv
+ERR_CH_NOT_ACTIVATED = 0x200
+
+MEM_MON_FRAMES = 256
+
+
+###########
+# Helpers #
+###########
+
+def atoi(s):
+    try:
+        return int(s)
+    except ValueError:
+        return 0
+
+
+# Mirror 'parseOpPars' in 'src/GbtCommon.c': All parameters are ','-separated.
+def parse_op_pars(address):
+    if isinstance(address, bytes):
+        address = address.decode()
+    return address.split('\0')[0].split(',')
+
+
+# What a service reports before it has ever been updated.
+def empty_value(fmt):
+    return (0, '') if fmt.endswith(';C') else (0,)
+
+
+def fixed_pattern_mem(fiber, opts, pattern=0xc4, tx_datavalid=0x80, header=0,
+                      size=MEM_MON_FRAMES):
+    frame = bytearray([pattern]*16)
+    frame[12] = tx_datavalid
+    frame[13] = header
+    return bytes(frame)*size
+
+
+################
+# gbtserv stub #
+################
+
+class GbtServ(object):
+    def __init__(self, host=GBT_SERV, latency=0.0,
+                 mem_source=fixed_pattern_mem, strict=False):
+        self.host = host
+        self.latency = latency
+        self.mem_source = mem_source
+        # A real gbtserv remembers channels activated by earlier clients, and
+        # drops overlapping commands, see 'nanoDAQ.gbtclient.transport'. When
+        # not strict, pretend neither happens.
+        self.strict = strict
+        self.busy = set()
+
+        self.lock = RLock()
+        self.services = {}
+        self.subscribers = defaultdict(dict)
+        self.ids = count(1)
+
+        self.i2c_chs = set()
+        self.i2c_regs = defaultdict(dict)
+
+        self.gpio_chs = set()
+        self.gpio_dir = defaultdict(int)
+        self.gpio_out = defaultdict(int)
+        self.gpio_in = defaultdict(lambda: 0xffffffff)
+
+        self.fpga_regs = {}
+
+    def srvc(self, name):
+        return '{}/{}/{}'.format(GBT_PREF, self.host, name)
+
+    def ch_status(self, ch, activated):
+        if self.strict and ch not in activated:
+            return ERR_CH_NOT_ACTIVATED
+        return 0
+
+    def wait(self, name):
+        latency = self.latency(name) if callable(self.latency) \
+            else self.latency
+        if latency:
+            sleep(latency)
+
+    ####################
+    # Service updating #
+    ####################
+
+    def update(self, name, *value):
+        with self.lock:
+            self.services[name] = value
+            callbacks = list(self.subscribers[name].values())
+
+        for cb in callbacks:
+            cb(*value)
+
+    def value(self, name, default=None):
+        with self.lock:
+            return self.services.get(name, default)
+
+    ##################
+    # I2C operations #
+    ##################
+
+    def i2c_reg(self, gbt, sca, bus, addr, i2c_type):
+        key = (gbt, sca, bus, addr)
+        regs = self.i2c_regs[key]
+
+        # A freshly powered GBTx reports 'Idle' in its state register.
+        if i2c_type == 0 and GBTX_STATUS_REG not in regs:
+            regs[GBTX_STATUS_REG] = int(GBTX_IDLE, base=16)
+
+        return regs
+
+    def cmnd_i2c(self, args):
+        address, data = args
+        pars = parse_op_pars(address)
+        opcode, gbt, sca, bus = map(atoi, pars[:4])
+        ch = (gbt, sca, bus)
+
+        if opcode == SCA_OP_MODE['activate_ch']:
+            self.i2c_chs.add(ch)
+            self.update(self.srvc('SrvcI2CWrite'), 0)
+            return
+        elif opcode == SCA_OP_MODE['deactivate_ch']:
+            self.i2c_chs.discard(ch)
+            self.update(self.srvc('SrvcI2CWrite'), 0)
+            return
+
+        pars += ['']*(10-len(pars))
+        addr = atoi(pars[4])
+        sub_addr = 0 if pars[5] == '' else atoi(pars[5])
+        size = atoi(pars[6])
+        i2c_type = atoi(pars[7])
+
+        if len(pars) > 10:
+            with open(pars[10]) as f:
+                data = bytes(int(v, base=16) for v in f.read().split())[:size]
+        else:
+            data = dim_bytes(data)
+
+        status = self.ch_status(ch, self.i2c_chs)
+        regs = self.i2c_reg(gbt, sca, bus, addr, i2c_type)
+
+        if opcode in (SCA_OP_MODE['write'], SCA_OP_MODE['writeread']) \
+                and not status:
+            for i, d in enumerate(data[:size]):
+                regs[sub_addr+i] = d
+
+        if opcode == SCA_OP_MODE['write']:
+            self.update(self.srvc('SrvcI2CWrite'), status)
+
+        elif opcode in (SCA_OP_MODE['read'], SCA_OP_MODE['writeread']):
+            if status:
+                readback = bytes(size)
+            else:
+                readback = bytes(regs.get(sub_addr+i, 0) for i in range(size))
+            self.update(self.srvc('SrvcI2CRead'), status, dim_str(readback))
+
+    ###################
+    # GPIO operations #
+    ###################
+
+    def gpio_levels(self, sca):
+        direction = self.gpio_dir[sca]
+        return ((self.gpio_out[sca] & direction) |
+                (self.gpio_in[sca] & ~direction)) & 0xffffffff
+
+    def gpio_level(self, sca, line):
+        return self.gpio_levels(sca) >> line & 1
+
+    def gpio_reg(self, sca, reg):
+        if reg == GPIO_REG['datain']:
+            return self.gpio_levels(sca)
+        elif reg == GPIO_REG['dataout']:
+            return self.gpio_out[sca]
+        elif reg == GPIO_REG['direction']:
+            return self.gpio_dir[sca]
+        return 0
+
+    def cmnd_gpio(self, args):
+        address, data = args
+        pars = parse_op_pars(address)
+        pars += ['']*(4-len(pars))
+        opcode, gbt, sca, line = map(atoi, pars[:4])
+        sca = (gbt, sca)
+        val = int.from_bytes(dim_bytes(data), 'big')
+
+        if opcode == SCA_OP_MODE['activate_ch']:
+            self.gpio_chs.add(sca)
+            self.update(self.srvc('SrvcGPIOWrite'), 0)
+            return
+
+        status = self.ch_status(sca, self.gpio_chs)
+        mask = 1 << line
+
+        # Raw register access, where 'line' is the register address.
+        if opcode == SCA_OP_MODE['write']:
+            if not status and line == GPIO_REG['w_dataout']:
+                self.gpio_out[sca] = val
+            elif not status and line == GPIO_REG['w_direction']:
+                self.gpio_dir[sca] = val
+            self.update(self.srvc('SrvcGPIOWrite'), status)
+
+        elif opcode == SCA_OP_MODE['read']:
+            self.update(self.srvc('SrvcGPIORead'), status,
+                        dim_str(self.gpio_reg(sca, line).to_bytes(4, 'big')))
+
+        elif opcode in (SCA_OP_MODE['gpio_setdir'],
+                      SCA_OP_MODE['gpio_setline']):
+            regs = self.gpio_dir if opcode == SCA_OP_MODE['gpio_setdir'] \
+                else self.gpio_out
+            if not status:
+                regs[sca] = regs[sca] | mask if val else regs[sca] & ~mask
+            self.update(self.srvc('SrvcGPIOWrite'), status)
+
+        elif opcode in (SCA_OP_MODE['gpio_getdir'],
+                        SCA_OP_MODE['gpio_getline']):
+            if opcode == SCA_OP_MODE['gpio_getdir']:
+                bit = 1 if self.gpio_dir[sca] & mask else 0
+            else:
+                bit = self.gpio_level(sca, line)
+            self.update(self.srvc('SrvcGPIORead'), status,
+                        dim_str(bit.to_bytes(4, 'big')))
+
+    ############################
+    # FPGA register operations #
+    ############################
+
+    def mem_mon_fiber(self, tell40):
+        raw = self.fpga_regs.get((tell40, 'top_tell40.monitoring_fiber'))
+        if not raw:
+            return None
+        return int.from_bytes(raw, 'big').bit_length() - 1
+
+    def cmnd_fpga(self, name, args):
+        tell40, reg = name.split('/')[-1].split('.', 1)
+        mode, data = args
+        mode = atoi(mode) if isinstance(mode, str) else mode
+
+        if mode == 0:
+            self.fpga_regs[(tell40, reg)] = dim_bytes(data)
+            self.update(self.srvc('SrvcWritings/{}.{}'.format(tell40, reg)), 0)
+        else:
+            if reg == 'top_tell40_monitoring.memory':
+                opts = self.fpga_regs.get(
+                    (tell40, 'top_tell40.monitoring_options'))
+                value = self.mem_source(self.mem_mon_fiber(tell40), opts)
+            else:
+                value = self.fpga_regs.get((tell40, reg), bytes(4))
+            self.update(self.srvc('SrvcReadings/{}.{}'.format(tell40, reg)),
+                        0, dim_str(value))
+
+    ############################
+    # pydim-compatible methods #
+    ############################
+
+    def dispatch(self, name, args):
+        with self.lock:
+            if name == self.srvc('CmndI2COperation'):
+                self.cmnd_i2c(args)
+            elif name == self.srvc('CmndGPIOOperation'):
+                self.cmnd_gpio(args)
+            elif name.startswith(self.srvc('CmndOperation/')):
+                self.cmnd_fpga(name, args)
+            else:
+                return 0
+        return 1
+
+    def acquire(self, name):
+        with self.lock:
+            if self.strict and name in self.busy:
+                return False
+            self.busy.add(name)
+            return True
+
+    def process(self, name, args):
+        self.wait(name)
+        try:
+            return self.dispatch(name, args)
+        finally:
+            with self.lock:
+                self.busy.discard(name)
+
+    # A dropped command is still delivered to gbtserv, so DIM reports success.
+    def dic_sync_cmnd_service(self, name, args, fmt, timeout=None):
+        if not self.acquire(name):
+            return 1
+        return self.process(name, args)
+
+    def dic_sync_info_service(self, name, fmt, timeout=None, default=None):
+        self.wait(name)
+        return self.value(name, empty_value(fmt) if default is None
+                          else default)
+
+    def dic_info_service(self, name, fmt, callback, service_type=0, timeout=0,
+                         tag=0, default=None):
+        sid = next(self.ids)
+        with self.lock:
+            self.subscribers[name][sid] = callback
+            value = self.services.setdefault(name, empty_value(fmt))
+
+        callback(*value)
+        return sid
+
+    def dic_release_service(self, sid):
+        with self.lock:
+            for subscribers in self.subscribers.values():
+                subscribers.pop(sid, None)
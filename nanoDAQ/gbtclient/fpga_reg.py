@@ -2,16 +2,15 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Sun Jan 05, 2020 at 03:39 AM -0500
+# Last Change: Mon Oct 19, 2026 at 03:05 AM +0800
 
-import pydim
-
-from nanoDAQ.gbtclient.common import GBT_PREF, GBT_SERV, TELL40
+from nanoDAQ.gbtclient.common import TELL40, fpga_srvc, dim_bytes
 from nanoDAQ.gbtclient.common import dim_cmd_err, dim_dic_err
 from nanoDAQ.gbtclient.common import default_dim_regulator as ddr
+from nanoDAQ.gbtclient.transport import get_transport, dim_request
 
 from nanoDAQ.utils import chunks, exec_guard
-from nanoDAQ.elink import elink_parser
+from nanoDAQ.elink import ElinkFrameBatch, elink_parser, elink_decode
 
 
 #############
@@ -31,11 +30,9 @@ FPGA_REG_OP_MODE = {
 # Memory monitoring #
 #####################
 
+# Indexing a memoryview gives ints, and slicing it doesn't copy.
 def mem_mon_decode(mem):
-    if isinstance(mem, bytes):
-        return [int(m) for m in mem]
-    elif isinstance(mem, str):
-        return [ord(m) for m in mem]
+    return memoryview(dim_bytes(mem))
 
 
 def mem_mon_regulator(tp):
@@ -44,68 +41,111 @@ def mem_mon_regulator(tp):
     return (tp[0], elk_df_lst)
 
 
+# Decode into a (16, N) array instead, see 'elink_decode'.
+def mem_mon_array_regulator(tp):
+    return (tp[0], elink_decode(mem_mon_decode(tp[1])))
+
+
+def mem_mon_batch_regulator(tp):
+    return (tp[0], ElinkFrameBatch.from_buffer(mem_mon_decode(tp[1])))
+
+
 def fiber_channel(n):
     ch_str = hex(1 << n)[2:]
     ch_padded = ch_str.rjust(8, '0')
     return bytes.fromhex(ch_padded)
 
 
-def mem_mon_read(tell40=TELL40, regulator=mem_mon_regulator):
-    ret = pydim.dic_sync_cmnd_service(
-        '{}/{}/CmndOperation/{}.top_tell40_monitoring.memory'.format(
-            GBT_PREF, GBT_SERV, tell40),
+def mem_mon_read(tell40=TELL40, regulator=mem_mon_batch_regulator):
+    ret = get_transport().cmnd(
+        fpga_srvc('CmndOperation', 'top_tell40_monitoring.memory', tell40),
         (FPGA_REG_OP_MODE['read'], '0'), 'C:1;C')
     dim_cmd_err(ret)
 
-    ret = pydim.dic_sync_info_service(
-        '{}/{}/SrvcReadings/{}.top_tell40_monitoring.memory'.format(
-            GBT_PREF, GBT_SERV, tell40), 'I:1;C')
+    ret = get_transport().info(
+        fpga_srvc('SrvcReadings', 'top_tell40_monitoring.memory', tell40),
+        'I:1;C')
+    return dim_dic_err(regulator(ret), FPGA_REG_ERR_CODE)
+
+
+# Same as 'mem_mon_read', but waits for the reading to be updated, for use
+# alongside other readers of the same TELL40.
+def mem_mon_request(tell40=TELL40, regulator=mem_mon_batch_regulator):
+    ret = dim_request(
+        fpga_srvc('CmndOperation', 'top_tell40_monitoring.memory', tell40),
+        (FPGA_REG_OP_MODE['read'], '0'), 'C:1;C',
+        fpga_srvc('SrvcReadings', 'top_tell40_monitoring.memory', tell40),
+        'I:1;C')
     return dim_dic_err(regulator(ret), FPGA_REG_ERR_CODE)
 
 
 def mem_mon_fiber_write(fiber, tell40=TELL40):
     fiber = fiber_channel(fiber)
-    ret = pydim.dic_sync_cmnd_service(
-        '{}/{}/CmndOperation/{}.top_tell40.monitoring_fiber'.format(
-            GBT_PREF, GBT_SERV, tell40),
+    ret = get_transport().cmnd(
+        fpga_srvc('CmndOperation', 'top_tell40.monitoring_fiber', tell40),
         (FPGA_REG_OP_MODE['write'], fiber), 'C:1;C')
     dim_cmd_err(ret)
 
 
 def mem_mon_fiber_read(tell40=TELL40, regulator=ddr):
-    ret = pydim.dic_sync_cmnd_service(
-        '{}/{}/CmndOperation/{}.top_tell40.monitoring_fiber'.format(
-            GBT_PREF, GBT_SERV, tell40),
+    ret = get_transport().cmnd(
+        fpga_srvc('CmndOperation', 'top_tell40.monitoring_fiber', tell40),
         (FPGA_REG_OP_MODE['read'], '0'), 'C:1;C')
     dim_cmd_err(ret)
 
-    ret = pydim.dic_sync_info_service(
-        '{}/{}/SrvcReadings/{}.top_tell40.monitoring_fiber'.format(
-            GBT_PREF, GBT_SERV, tell40), 'I:1;C')
+    ret = get_transport().info(
+        fpga_srvc('SrvcReadings', 'top_tell40.monitoring_fiber', tell40),
+        'I:1;C')
     return dim_dic_err(regulator(ret), FPGA_REG_ERR_CODE)
 
 
 def mem_mon_options_write(opts=b'\x00\x00\x00\x1c', tell40=TELL40):
-    ret = pydim.dic_sync_cmnd_service(
-        '{}/{}/CmndOperation/{}.top_tell40.monitoring_options'.format(
-            GBT_PREF, GBT_SERV, tell40),
+    ret = get_transport().cmnd(
+        fpga_srvc('CmndOperation', 'top_tell40.monitoring_options', tell40),
         (FPGA_REG_OP_MODE['write'], opts), 'C:1;C')
     dim_cmd_err(ret)
 
 
 def mem_mon_options_read(tell40=TELL40, regulator=ddr):
-    ret = pydim.dic_sync_cmnd_service(
-        '{}/{}/CmndOperation/{}.top_tell40.monitoring_options'.format(
-            GBT_PREF, GBT_SERV, tell40),
+    ret = get_transport().cmnd(
+        fpga_srvc('CmndOperation', 'top_tell40.monitoring_options', tell40),
         (FPGA_REG_OP_MODE['read'], '0'), 'C:1;C')
     dim_cmd_err(ret)
 
-    ret = pydim.dic_sync_info_service(
-        '{}/{}/SrvcReadings/{}.top_tell40.monitoring_options'.format(
-            GBT_PREF, GBT_SERV, tell40), 'I:1;C')
+    ret = get_transport().info(
+        fpga_srvc('SrvcReadings', 'top_tell40.monitoring_options', tell40),
+        'I:1;C')
     return dim_dic_err(regulator(ret), FPGA_REG_ERR_CODE)
 
 
+####################################
+# Memory monitoring of many fibers #
+####################################
+
+def fiber_index(raw):
+    return int(raw, base=16).bit_length() - 1
+
+
+# Read 'num' blocks of each fiber in turn, in a single session. Return
+# {fiber: batch}, or {fiber: [batch, ...]} if not 'concat'. The fiber
+# selected before is restored afterwards.
+def mem_mon_sweep(fibers, num=1, tell40=TELL40, concat=True, restore=True):
+    prev = fiber_index(mem_mon_fiber_read(tell40))
+    result = dict()
+
+    try:
+        for fiber in fibers:
+            mem_mon_fiber_write(fiber, tell40)
+            batches = [mem_mon_read(tell40) for _ in range(num)]
+            result[fiber] = ElinkFrameBatch.concat(batches) if concat \
+                else batches
+    finally:
+        if restore and prev >= 0:
+            mem_mon_fiber_write(prev, tell40)
+
+    return result
+
+
 # Wrap FPGA operations so that they run in separate processes.
 mem_mon_read_safe = lambda *args, **kwargs: \
     exec_guard(mem_mon_read, *args, **kwargs)
@@ -117,3 +157,5 @@ mem_mon_options_write_safe = lambda *args, **kwargs: \
     exec_guard(mem_mon_options_write, *args, **kwargs)
 mem_mon_options_read_safe = lambda *args, **kwargs: \
     exec_guard(mem_mon_options_read, *args, **kwargs)
+mem_mon_sweep_safe = lambda *args, **kwargs: \
+    exec_guard(mem_mon_sweep, *args, **kwargs)
@@ -2,16 +2,15 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Mon Dec 30, 2019 at 12:34 AM -0500
-
-import pydim
+# Last Change: Mon Oct 19, 2026 at 03:05 AM +0800
 
 from sty import fg, ef, rs
 
-from nanoDAQ.gbtclient.common import GBT_PREF, GBT_SERV, SCA_OP_MODE
-from nanoDAQ.gbtclient.common import hex_to_bytes
+from nanoDAQ.gbtclient.common import SCA_OP_MODE
+from nanoDAQ.gbtclient.common import to_bytes, bytes_regulator
 from nanoDAQ.gbtclient.common import dim_cmd_err, dim_dic_err
 from nanoDAQ.gbtclient.common import default_dim_regulator as ddr
+from nanoDAQ.gbtclient.transport import get_transport, dim_request
 
 
 #############
@@ -34,6 +33,26 @@ GPIO_LEVEL = {
 
 GPIO_LEVEL_INVERSE = {int(v): k for k, v in GPIO_LEVEL.items()}
 
+# GBT-SCA GPIO channel registers, addressed by their command codes. Each holds
+# one bit per line.
+GPIO_REG = {
+    'datain':      0x01,
+    'w_dataout':   0x10,
+    'dataout':     0x11,
+    'w_direction': 0x20,
+    'direction':   0x21,
+}
+
+GPIO_REPLY_SRVC = {
+    SCA_OP_MODE['activate_ch']:  ('SrvcGPIOWrite', 'I:1'),
+    SCA_OP_MODE['write']:        ('SrvcGPIOWrite', 'I:1'),
+    SCA_OP_MODE['gpio_setdir']:  ('SrvcGPIOWrite', 'I:1'),
+    SCA_OP_MODE['gpio_setline']: ('SrvcGPIOWrite', 'I:1'),
+    SCA_OP_MODE['read']:         ('SrvcGPIORead', 'I:1;C'),
+    SCA_OP_MODE['gpio_getdir']:  ('SrvcGPIORead', 'I:1;C'),
+    SCA_OP_MODE['gpio_getline']: ('SrvcGPIORead', 'I:1;C'),
+}
+
 GPIO_LEVEL_LOOKUP = {
     1: fg.green+ef.bold+'H'+rs.bold_dim+fg.rs,
     0: fg.red+ef.bold+'L'+rs.bold_dim+fg.rs,
@@ -44,41 +63,39 @@ GPIO_LEVEL_LOOKUP = {
 # GPIO Operations #
 ###################
 
-def gpio_op(mode, gbt, sca, addr, data=None):
+def gpio_args(mode, gbt, sca, addr, data=None):
     cmd = ','.join(map(str,
                        (mode, gbt, sca, addr)))
 
     if not data:
         data = '0'
-    data = hex_to_bytes(data)
+    data = to_bytes(data)
+
+    return (cmd, data)
 
-    args = (cmd, data)
-    ret = pydim.dic_sync_cmnd_service(
-        '{}/{}/CmndGPIOOperation'.format(GBT_PREF, GBT_SERV),
-        args, 'C:128;C')
+
+def gpio_op(*args, **kwargs):
+    ret = get_transport().cmnd('CmndGPIOOperation', gpio_args(*args, **kwargs),
+                               'C:128;C')
     dim_cmd_err(ret)
 
 
-def gpio_write(*args, regulator=ddr, **kwargs):
-    gpio_op(SCA_OP_MODE['write'], *args, **kwargs)
-    ret = pydim.dic_sync_info_service(
-        '{}/{}/SrvcGPIOWrite'.format(GBT_PREF, GBT_SERV),
-        'I:1'
-    )
+def gpio_request(mode, *args, regulator=ddr, **kwargs):
+    ret = dim_request('CmndGPIOOperation', gpio_args(mode, *args, **kwargs),
+                      'C:128;C', *GPIO_REPLY_SRVC[mode])
     return dim_dic_err(regulator(ret), GPIO_ERR_CODE)
 
 
-def gpio_read(*args, regulator=ddr, **kwargs):
-    gpio_op(SCA_OP_MODE['read'], *args, **kwargs)
-    ret = pydim.dic_sync_info_service(
-        '{}/{}/SrvcGPIORead'.format(GBT_PREF, GBT_SERV),
-        'I:1;C'
-    )
-    return dim_dic_err(regulator(ret), GPIO_ERR_CODE)
+def gpio_write(*args, **kwargs):
+    return gpio_request(SCA_OP_MODE['write'], *args, **kwargs)
+
+
+def gpio_read(*args, **kwargs):
+    return gpio_request(SCA_OP_MODE['read'], *args, **kwargs)
 
 
 def gpio_activate_ch(gbt, sca, **kwargs):
-    gpio_op(SCA_OP_MODE['activate_ch'], gbt, sca, 0, **kwargs)
+    gpio_request(SCA_OP_MODE['activate_ch'], gbt, sca, 0, **kwargs)
 
 
 ######################
@@ -86,28 +103,73 @@ def gpio_activate_ch(gbt, sca, **kwargs):
 ######################
 
 def gpio_setdir(*args, direction='out', **kwargs):
-    gpio_op(SCA_OP_MODE['gpio_setdir'], *args,
-            data=GPIO_DIR[direction], **kwargs)
+    gpio_request(SCA_OP_MODE['gpio_setdir'], *args,
+                 data=GPIO_DIR[direction], **kwargs)
 
 
 def gpio_setline(*args, level='high', **kwargs):
-    gpio_op(SCA_OP_MODE['gpio_setline'], *args,
-            data=GPIO_LEVEL[level], **kwargs)
-
-
-def gpio_getdir(*args, regulator=ddr, **kwargs):
-    gpio_op(SCA_OP_MODE['gpio_getdir'], *args, **kwargs)
-    ret = pydim.dic_sync_info_service(
-        '{}/{}/SrvcGPIORead'.format(GBT_PREF, GBT_SERV),
-        'I:1;C'
-    )
-    return int(dim_dic_err(regulator(ret), GPIO_ERR_CODE), base=16)
-
-
-def gpio_getline(*args, regulator=ddr, **kwargs):
-    gpio_op(SCA_OP_MODE['gpio_getline'], *args, **kwargs)
-    ret = pydim.dic_sync_info_service(
-        '{}/{}/SrvcGPIORead'.format(GBT_PREF, GBT_SERV),
-        'I:1;C'
-    )
-    return int(dim_dic_err(regulator(ret), GPIO_ERR_CODE), base=16)
+    gpio_request(SCA_OP_MODE['gpio_setline'], *args,
+                 data=GPIO_LEVEL[level], **kwargs)
+
+
+def gpio_getdir(*args, regulator=bytes_regulator, **kwargs):
+    return int.from_bytes(to_bytes(gpio_request(
+        SCA_OP_MODE['gpio_getdir'], *args, regulator=regulator, **kwargs)),
+        'big')
+
+
+def gpio_getline(*args, regulator=bytes_regulator, **kwargs):
+    return int.from_bytes(to_bytes(gpio_request(
+        SCA_OP_MODE['gpio_getline'], *args, regulator=regulator, **kwargs)),
+        'big')
+
+
+##########################
+# Multi-line GPIO access #
+##########################
+
+def gpio_read_reg(gbt, sca, reg):
+    return int.from_bytes(gpio_read(gbt, sca, GPIO_REG[reg],
+                                    regulator=bytes_regulator), 'big')
+
+
+def gpio_write_reg(gbt, sca, reg, val):
+    gpio_write(gbt, sca, GPIO_REG['w_'+reg], data=val.to_bytes(4, 'big'))
+
+
+def lines_to_mask(lines):
+    mask = 0
+    for l in lines:
+        mask |= 1 << l
+    return mask
+
+
+def mask_to_lines(val, lines):
+    return {l: (val >> l) & 1 for l in lines}
+
+
+# Read direction and level of all lines in two round-trips. Each read waits for
+# its own reply, so the second can't return the first one's.
+def gpio_snapshot(gbt, sca, lines=range(32)):
+    direction = gpio_read_reg(gbt, sca, 'direction')
+    level = gpio_read_reg(gbt, sca, 'datain')
+    return {l: (d, level >> l & 1)
+            for l, d in mask_to_lines(direction, lines).items()}
+
+
+# Only touch the lines in 'mask'; the others keep their current values.
+def gpio_update_reg(gbt, sca, reg, mask, bit):
+    cur = gpio_read_reg(gbt, sca, reg)
+    val = cur | mask if bit else cur & ~mask
+    if val != cur:
+        gpio_write_reg(gbt, sca, reg, val)
+
+
+def gpio_setdir_mask(gbt, sca, mask, direction='out'):
+    gpio_update_reg(gbt, sca, 'direction', mask,
+                    int(GPIO_DIR[direction], base=16))
+
+
+def gpio_setline_mask(gbt, sca, mask, level='high'):
+    gpio_update_reg(gbt, sca, 'dataout', mask,
+                    int(GPIO_LEVEL[level], base=16))
@@ -2,14 +2,15 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Wed Jul 01, 2020 at 07:18 PM +0800
+# Last Change: Mon Oct 19, 2026 at 03:05 AM +0800
 
-import pydim
+from functools import lru_cache
 
-from nanoDAQ.gbtclient.common import GBT_PREF, GBT_SERV, SCA_OP_MODE
-from nanoDAQ.gbtclient.common import hex_to_bytes
+from nanoDAQ.gbtclient.common import SCA_OP_MODE
+from nanoDAQ.gbtclient.common import to_bytes, bytes_regulator
 from nanoDAQ.gbtclient.common import dim_cmd_err, dim_dic_err
 from nanoDAQ.gbtclient.common import default_dim_regulator as ddr
+from nanoDAQ.gbtclient.transport import get_transport, dim_request
 
 from nanoDAQ.exceptions import GBTError
 
@@ -37,90 +38,162 @@ I2C_ERR_CODE = {
 }
 
 
+####################
+# I2C transactions #
+####################
+
+I2C_REPLY_SRVC = {
+    SCA_OP_MODE['activate_ch']: ('SrvcI2CWrite', 'I:1'),
+    SCA_OP_MODE['write']:     ('SrvcI2CWrite', 'I:1'),
+    SCA_OP_MODE['read']:      ('SrvcI2CRead', 'I:1;C'),
+    SCA_OP_MODE['writeread']: ('SrvcI2CRead', 'I:1;C'),
+}
+
+
+# Everything but the data is fixed for a given set of I2C parameters, so build
+# the command once and reuse it.
+class I2CTransaction(object):
+    max_payloads = 64
+
+    def __init__(self, mode, gbt, sca, bus, addr, sub_addr, size,
+                 i2c_type, i2c_freq, scl=0, filepath=None):
+        self.cmd = ','.join(map(str,
+                                (mode, gbt, sca, bus, addr, sub_addr, size,
+                                 i2c_type, i2c_freq, scl)))
+        if filepath:
+            self.cmd += ',{}'.format(filepath)
+
+        self.reply = I2C_REPLY_SRVC.get(mode)
+        self.payloads = {}
+
+    def args(self, data=None):
+        if not data:
+            data = '0'
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            return (self.cmd, bytes(data))
+
+        try:
+            payload = self.payloads[data]
+        except KeyError:
+            if len(self.payloads) >= self.max_payloads:
+                self.payloads.clear()
+            # Note that the input parameter 'data' should be either bytes, or
+            # hex numbers in string e.g. 'abad1dea', without '0x' prefix!
+            payload = self.payloads[data] = to_bytes(data)
+
+        return (self.cmd, payload)
+
+    def send(self, data=None):
+        ret = get_transport().cmnd('CmndI2COperation', self.args(data),
+                                   'C:128;C')
+        dim_cmd_err(ret)
+
+    def request(self, data=None, regulator=ddr):
+        ret = dim_request('CmndI2COperation', self.args(data), 'C:128;C',
+                          *self.reply)
+        return dim_dic_err(regulator(ret), I2C_ERR_CODE)
+
+
+@lru_cache(maxsize=1024)
+def i2c_prepare(*args, **kwargs):
+    return I2CTransaction(*args, **kwargs)
+
+
 ##################
 # I2C Operations #
 ##################
 
-def i2c_op(mode, gbt, sca, bus, addr, sub_addr, size, i2c_type, i2c_freq,
-           scl=0, filepath=None, data=None):
-    cmd = ','.join(map(str,
-                       (mode, gbt, sca, bus, addr, sub_addr, size,
-                        i2c_type, i2c_freq, scl)))
-    if filepath:
-        cmd += ',{}'.format(filepath)
-
-    if not data:
-        data = '0'
-    # Note that the input parameter 'data' should be hex numbers in string
-    # e.g. 'abad1dea', note that there's no '0x' prefix!
-    data = hex_to_bytes(data)
-
-    args = (cmd, data)
-
-    ret = pydim.dic_sync_cmnd_service(
-        '{}/{}/CmndI2COperation'.format(GBT_PREF, GBT_SERV),
-        args, 'C:128;C')
-    dim_cmd_err(ret)
-
-
-def i2c_write(*args, regulator=ddr, **kwargs):
-    i2c_op(SCA_OP_MODE['write'], *args, **kwargs)
-    ret = pydim.dic_sync_info_service(
-        '{}/{}/SrvcI2CWrite'.format(GBT_PREF, GBT_SERV),
-        'I:1'
-    )
-    return dim_dic_err(regulator(ret), I2C_ERR_CODE)
-
-
-def i2c_read(*args, regulator=ddr, **kwargs):
-    # FIXME: The operation order doesn't make sense.
-    i2c_op(SCA_OP_MODE['read'], *args, **kwargs)
-    pydim.dic_sync_info_service(
-        '{}/{}/SrvcI2CRead'.format(GBT_PREF, GBT_SERV),
-        'I:1;C'
-    )
-    ret = pydim.dic_sync_info_service(
-        '{}/{}/SrvcI2CRead'.format(GBT_PREF, GBT_SERV),
-        'I:1;C'
-    )
-    return dim_dic_err(regulator(ret), I2C_ERR_CODE)
-
-
-def i2c_writeread(*args, regulator=ddr, **kwargs):
-    # FIXME: The operation order doesn't make sense.
-    i2c_op(SCA_OP_MODE['writeread'], *args, **kwargs)
-    pydim.dic_sync_info_service(
-        '{}/{}/SrvcI2CRead'.format(GBT_PREF, GBT_SERV),
-        'I:1;C'
-    )
-    ret = pydim.dic_sync_info_service(
-        '{}/{}/SrvcI2CRead'.format(GBT_PREF, GBT_SERV),
-        'I:1;C'
-    )
-    return dim_dic_err(regulator(ret), I2C_ERR_CODE)
+def i2c_args(*args, data=None, **kwargs):
+    return i2c_prepare(*args, **kwargs).args(data)
+
+
+def i2c_op(*args, data=None, **kwargs):
+    i2c_prepare(*args, **kwargs).send(data)
+
+
+def i2c_write(*args, regulator=ddr, data=None, **kwargs):
+    return i2c_prepare(SCA_OP_MODE['write'], *args, **kwargs).request(
+        data, regulator)
+
+
+def i2c_read(*args, regulator=ddr, data=None, **kwargs):
+    return i2c_prepare(SCA_OP_MODE['read'], *args, **kwargs).request(
+        data, regulator)
+
+
+def i2c_writeread(*args, regulator=ddr, data=None, **kwargs):
+    return i2c_prepare(SCA_OP_MODE['writeread'], *args, **kwargs).request(
+        data, regulator)
 
 
 def i2c_activate_ch(gbt, sca, bus, **kwargs):
-    i2c_op(SCA_OP_MODE['activate_ch'], gbt, sca, bus, 0, 0, 0, 0, 0, **kwargs)
+    i2c_prepare(SCA_OP_MODE['activate_ch'], gbt, sca, bus, 0, 0, 0, 0, 0,
+                **kwargs).request()
 
 
 #############################
 # High-level I2C Operations #
 #############################
 
+# Turn a sequence of (addr, sub_addr, data) writes into a plan with fewer
+# transactions, without reordering any write:
+#   - Writing a value that a register already holds is dropped.
+#   - A write that continues the previous one, i.e. same address and the next
+#     sub-address, is merged into it as a multi-byte write.
+def i2c_compile_seq(seq):
+    plan = []
+    written = {}
+
+    for addr, sub_addr, data in seq:
+        for i, byte in enumerate(to_bytes(data)):
+            reg = (addr, sub_addr+i)
+            if written.get(reg) == byte:
+                continue
+            written[reg] = byte
+
+            last = plan[-1] if plan else None
+            if last and last[0] == addr and \
+                    last[1] + len(last[2]) == reg[1]:
+                last[2].append(byte)
+            else:
+                plan.append([addr, reg[1], [byte]])
+
+    return [(addr, sub_addr, bytes(data).hex())
+            for addr, sub_addr, data in plan]
+
+
+# Verify the readback chunk by chunk, and only rewrite the chunks that
+# mismatch. The first attempt is still a single transaction for the whole
+# payload.
 def i2c_write_verify(*args, filepath=None, max_retry=5, error=GBTError,
-                     **kwargs):
-    trial = 0
-    data = kwargs['data']
-    while trial < max_retry:
-        reg_val = i2c_writeread(*args, **kwargs)
-
-        if reg_val == data:
+                     chunk_size=32, **kwargs):
+    data = to_bytes(kwargs.pop('data'))
+    kwargs['regulator'] = bytes_regulator
+    head, sub_addr, size, tail = args[:4], args[4], args[5], args[6:]
+
+    reg_val = bytearray(i2c_writeread(*args, data=data, **kwargs))
+    pending = [(start, min(start+chunk_size, size))
+               for start in range(0, size, chunk_size)]
+
+    # 'max_retry' counts all attempts, including the first one.
+    trial = 1
+    while True:
+        pending = [(start, end) for start, end in pending
+                   if reg_val[start:end] != data[start:end]]
+        if not pending or trial >= max_retry:
             break
-        else:
-            trial += 1
 
-    if reg_val != data:
+        trial += 1
+        for start, end in pending:
+            reg_val[start:end] = i2c_writeread(
+                *head, sub_addr+start, end-start, *tail,
+                data=data[start:end], **kwargs)
+
+    if pending:
         raise error('Program failed at {}:{}. Expect {} but got {}'.format(
-            args[3], args[4], data, reg_val
+            args[3],
+            ', '.join('{}-{}'.format(sub_addr+start, sub_addr+end-1)
+                      for start, end in pending),
+            ', '.join(data[start:end].hex() for start, end in pending),
+            ', '.join(reg_val[start:end].hex() for start, end in pending)
         ))
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+#
+# Author: Yipeng Sun
+# License: BSD 2-clause
+# Last Change: Mon Oct 19, 2026 at 03:31 AM +0800
+#
+# All DIM traffic of 'nanoDAQ.gbtclient' goes through a transport. Service
+# names passed to a transport are relative to 'Gbt/<host>/'.
+
+import os
+import sys
+import pickle
+import runpy
+
+from argparse import ArgumentParser, REMAINDER
+from atexit import register
+from collections import defaultdict
+from importlib import import_module
+from threading import Condition, Lock, RLock
+
+from nanoDAQ.gbtclient.common import GBT_PREF, GBT_SERV, DIM_TIMEOUT
+from nanoDAQ.gbtclient.common import dim_cmd_err
+from nanoDAQ.exceptions import DIMError
+from nanoDAQ.utils import EXEC_POOL
+
+
+##############
+# Transports #
+##############
+
+class PydimTransport(object):
+    # Safe to be used from a forked worker process.
+    inline = False
+
+    def __init__(self, dim=None, host=GBT_SERV):
+        self._dim = dim
+        self.host = host
+        self.names = {}
+
+    @property
+    def dim(self):
+        # Only import pydim when it's actually used.
+        if self._dim is None:
+            self._dim = import_module('pydim')
+        return self._dim
+
+    def srvc(self, name):
+        try:
+            return self.names[name]
+        except KeyError:
+            srvc = self.names[name] = '{}/{}/{}'.format(
+                GBT_PREF, self.host, name)
+            return srvc
+
+    def cmnd(self, name, args, fmt):
+        return self.dim.dic_sync_cmnd_service(self.srvc(name), args, fmt)
+
+    def info(self, name, fmt):
+        return self.dim.dic_sync_info_service(self.srvc(name), fmt)
+
+    def subscribe(self, name, fmt, callback):
+        return self.dim.dic_info_service(self.srvc(name), fmt, callback)
+
+    def unsubscribe(self, sid):
+        self.dim.dic_release_service(sid)
+
+
+class EmulatedTransport(PydimTransport):
+    inline = True
+
+    def __init__(self, serv=None):
+        # The emulator imports the code it emulates, which imports this.
+        from nanoDAQ.gbtclient.emulator import GbtServ
+
+        serv = GbtServ() if serv is None else serv
+        super().__init__(serv, serv.host)
+
+
+class RecordingTransport(object):
+    inline = True
+
+    def __init__(self, inner, records=None):
+        self.inner = inner
+        self.records = [] if records is None else records
+
+    def record(self, kind, name, args, fmt, call):
+        # Reserve the slot first, as service updates triggered by this call may
+        # be recorded before it returns.
+        idx = len(self.records)
+        self.records.append(None)
+        ret = call()
+        self.records[idx] = (kind, name, args, fmt, ret)
+        return ret
+
+    def cmnd(self, name, args, fmt):
+        return self.record('cmnd', name, args, fmt,
+                           lambda: self.inner.cmnd(name, args, fmt))
+
+    def info(self, name, fmt):
+        return self.record('info', name, None, fmt,
+                           lambda: self.inner.info(name, fmt))
+
+    def subscribe(self, name, fmt, callback):
+        def recorded(*value):
+            self.records.append(('update', name, None, fmt, value))
+            callback(*value)
+
+        self.records.append(('subscribe', name, None, fmt, None))
+        return self.inner.subscribe(name, fmt, recorded)
+
+    def unsubscribe(self, sid):
+        self.inner.unsubscribe(sid)
+
+    def dump(self, filepath):
+        with open(filepath, 'wb') as f:
+            pickle.dump(self.records, f)
+
+
+class ReplayTransport(object):
+    inline = True
+
+    def __init__(self, records):
+        if isinstance(records, str):
+            with open(records, 'rb') as f:
+                records = pickle.load(f)
+
+        self.records = list(records)
+        self.cursor = 0
+        self.subscribers = {}
+
+    def next_record(self, kind, name):
+        try:
+            record = self.records[self.cursor]
+        except IndexError:
+            raise DIMError('Replay exhausted at {} {}.'.format(kind, name))
+
+        if record[:2] != (kind, name):
+            raise DIMError('Replay expects {} {}, but got {} {}.'.format(
+                record[0], record[1], kind, name))
+
+        self.cursor += 1
+        return record[-1]
+
+    def flush_updates(self):
+        while self.cursor < len(self.records) and \
+                self.records[self.cursor][0] == 'update':
+            _, name, _, _, value = self.records[self.cursor]
+            self.cursor += 1
+
+            for sname, cb in list(self.subscribers.values()):
+                if sname == name:
+                    cb(*value)
+
+    def cmnd(self, name, args, fmt):
+        ret = self.next_record('cmnd', name)
+        self.flush_updates()
+        return ret
+
+    def info(self, name, fmt):
+        ret = self.next_record('info', name)
+        self.flush_updates()
+        return ret
+
+    def subscribe(self, name, fmt, callback):
+        self.next_record('subscribe', name)
+        sid = len(self.subscribers) + 1
+        self.subscribers[sid] = (name, callback)
+        self.flush_updates()
+        return sid
+
+    def unsubscribe(self, sid):
+        self.subscribers.pop(sid, None)
+
+
+####################
+# Service monitors #
+####################
+
+# Subscribe to a DIM service once, and hand out the updates that arrive after
+# a given point in time.
+class ServiceMonitor(object):
+    def __init__(self, transport, name, fmt, sync_timeout=1):
+        self.name = name
+        self.cond = Condition()
+        self.value = None
+        self.updates = 0
+
+        self.sid = transport.subscribe(name, fmt, self.update)
+        # DIM delivers the current value right after subscription. Wait for it
+        # so that it's not mistaken as a reply to a later command.
+        with self.cond:
+            self.cond.wait_for(lambda: self.updates > 0, sync_timeout)
+
+    def update(self, *value):
+        with self.cond:
+            self.value = value
+            self.updates += 1
+            self.cond.notify_all()
+
+    # Return a marker for 'wait'.
+    def expect(self):
+        with self.cond:
+            return self.updates
+
+    def wait(self, after, timeout=DIM_TIMEOUT):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.updates > after, timeout):
+                raise DIMError('No update of {} received in {} s.'.format(
+                    self.name, timeout))
+            return self.value
+
+
+MONITORS = {}
+MONITORS_LOCK = Lock()
+
+
+def get_monitor(name, fmt, transport=None):
+    transport = get_transport() if transport is None else transport
+
+    with MONITORS_LOCK:
+        try:
+            return MONITORS[(transport, name)]
+        except KeyError:
+            monitor = MONITORS[(transport, name)] = \
+                ServiceMonitor(transport, name, fmt)
+            return monitor
+
+
+# gbtserv silently drops a command while the previous one on the same command
+# service is unfinished (see 'parseOpPars' in docs/comments.md), and replies on
+# services shared by all commands of a kind, e.g. 'SrvcI2CWrite' for I2C
+# writes and channel activation. So commands on the same command service take
+# turns, from sending the command to receiving its reply, whether they come
+# from threads or from 'nanoDAQ.gbtclient.aio'.
+CMND_LOCKS = defaultdict(RLock)
+
+
+def cmnd_lock(name, transport=None):
+    transport = get_transport() if transport is None else transport
+
+    with MONITORS_LOCK:
+        return CMND_LOCKS[(transport, name)]
+
+
+# Send a command, and return the first update of 'srvc' after it's sent, as a
+# plain fetch of the service may return the reply to a previous command.
+def dim_request(name, args, fmt, srvc, srvc_fmt, transport=None,
+                timeout=DIM_TIMEOUT):
+    transport = get_transport() if transport is None else transport
+    monitor = get_monitor(srvc, srvc_fmt, transport)
+
+    with cmnd_lock(name, transport):
+        after = monitor.expect()
+        dim_cmd_err(transport.cmnd(name, args, fmt))
+        return monitor.wait(after, timeout)
+
+
+#######################
+# Transport selection #
+#######################
+
+TRANSPORT = None
+
+
+def select_transport(spec):
+    kind, _, filepath = spec.partition(':')
+
+    if kind == 'pydim':
+        return PydimTransport()
+    elif kind == 'emulated':
+        return EmulatedTransport()
+    elif kind == 'record':
+        transport = RecordingTransport(PydimTransport())
+        register(transport.dump, filepath)
+        return transport
+    elif kind == 'replay':
+        return ReplayTransport(filepath)
+
+    raise ValueError('Unknown transport {}.'.format(spec))
+
+
+def set_transport(transport):
+    global TRANSPORT
+    TRANSPORT = transport
+    # In-process transports keep state that a forked worker can't share.
+    EXEC_POOL.inline = transport.inline
+    return transport
+
+
+def get_transport():
+    if TRANSPORT is None:
+        set_transport(select_transport(
+            os.environ.get('NANODAQ_TRANSPORT', 'pydim')))
+    return TRANSPORT
+
+
+################################
+# Command line argument parser #
+################################
+
+def parse_input(descr='Run a nanoDAQ script over a selected DIM transport.'):
+    parser = ArgumentParser(description=descr)
+
+    parser.add_argument('-t', '--transport',
+                        default='emulated',
+                        help='''
+specify transport: pydim|emulated|record:<file>|replay:<file>.
+''')
+
+    parser.add_argument('-l', '--latency',
+                        type=float,
+                        default=0.0,
+                        help='''
+specify per-call DIM latency of the emulated gbtserv, in seconds.
+''')
+
+    parser.add_argument('--strict',
+                        action='store_true',
+                        help='''
+require channels of the emulated gbtserv to be activated before use.
+''')
+
+    parser.add_argument('script',
+                        help='''
+specify script to run.
+''')
+
+    parser.add_argument('args',
+                        nargs=REMAINDER,
+                        help='''
+specify arguments passed to the script.
+''')
+
+    return parser
+
+
+if __name__ == '__main__':
+    # NOTE: When run with 'python -m', this file is '__main__', not the module
+    #       that 'nanoDAQ.gbtclient' imports, so select transport over there.
+    from nanoDAQ.gbtclient.transport import set_transport, select_transport
+    from nanoDAQ.gbtclient.emulator import GbtServ
+
+    args = parse_input().parse_args()
+
+    if args.transport == 'emulated':
+        set_transport(EmulatedTransport(
+            GbtServ(latency=args.latency, strict=args.strict)))
+    else:
+        set_transport(select_transport(args.transport))
+
+    sys.argv = [args.script] + args.args
+    runpy.run_path(args.script, run_name='__main__')
@@ -2,20 +2,20 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Fri Jan 17, 2020 at 03:14 AM -0500
+# Last Change: Sun Oct 18, 2026 at 09:55 PM +0800
 
 from collections import defaultdict, Counter
 from sty import fg
 
-from nanoDAQ.elink import elink_extract_chs, check_bit_shift
-from nanoDAQ.utils import most_common, exec_guard, hex_pad
+from nanoDAQ.elink import elink_extract_chs, elink_stats_chs, check_bit_shift
+from nanoDAQ.utils import exec_guard, hex_pad
 
 from nanoDAQ.gbtclient.fpga_reg import mem_mon_read_safe as mem_r
 
 from nanoDAQ.ut.salt import salt_cur_elk_phase, salt_elk_phase, \
     salt_ser_src, salt_tfc_phase, \
     SALT_TFC_VALID_PHASE
-from nanoDAQ.ut.dcb import dcb_elk_phase, DCB_ELK_VALID_PHASE
+from nanoDAQ.ut.dcb import dcb_elk_phases, DCB_ELK_VALID_PHASE
 
 
 ###################################
@@ -23,8 +23,7 @@ from nanoDAQ.ut.dcb import dcb_elk_phase, DCB_ELK_VALID_PHASE
 ###################################
 
 def adj_dcb_elink_phase(adjustment, gbt, slave):
-    for ch, ph in adjustment.items():
-        exec_guard(dcb_elk_phase, gbt, slave, ch, ph)
+    exec_guard(dcb_elk_phases, gbt, slave, adjustment)
 
 
 def adj_salt_elink_phase(pattern, gbt, bus, asic):
@@ -46,14 +45,9 @@ def adj_salt_tfc_phase(daq_chs, gbt, bus, asic):
     for ph in SALT_TFC_VALID_PHASE:
         exec_guard(salt_tfc_phase, gbt, bus, asic, ph)
         mem = elink_extract_chs(mem_r(), daq_chs)
+        _, stats = elink_stats_chs(mem)
 
-        good_chs = []
-        for ch, data in mem.items():
-            mode, _ = most_common(data)
-            if 0x04 == mode:
-                good_chs.append(ch)
-
-        if sorted(good_chs) == sorted(daq_chs):
+        if (stats.mode == 0x04).all():
             return True
 
     return False
@@ -83,15 +77,21 @@ def mid_elem(lst):
 # Elink phase alignment operations #
 ####################################
 
+# If a 'nanoDAQ.capture.CaptureWriter' is given, raw frames of each phase are
+# saved with the phase as tag, so that the scan can be redone offline with
+# 'nanoDAQ.capture.capture_loop_result'.
 def loop_phase_elk(daq_chs, gbt, slave,
-                   phases=DCB_ELK_VALID_PHASE, phase_tuner=dcb_elk_phase):
+                   phases=DCB_ELK_VALID_PHASE, phase_tuner=dcb_elk_phases,
+                   capture=None, fiber=None):
     loop_result = dict()
 
     for ph in phases:
-        for ch in daq_chs:
-            exec_guard(phase_tuner, gbt, slave, ch, ph)
+        exec_guard(phase_tuner, gbt, slave, {ch: ph for ch in daq_chs})
 
-        loop_result[ph] = elink_extract_chs(mem_r(), daq_chs)
+        batch = mem_r()
+        if capture is not None:
+            capture.write(batch, fiber=fiber, tag=int(ph, base=16))
+        loop_result[ph] = elink_extract_chs(batch, daq_chs)
 
     return loop_result
 
@@ -127,13 +127,13 @@ def scan_phase_elink(loop_result, phases=DCB_ELK_VALID_PHASE,
         idx = int(ph, base=16)
         printout[idx].append(ph)
 
-        for ch, data in chs_data.items():
-            num_of_frame = len(data)
-            mode, freq = most_common(data)
-            mode_display = hex_pad(mode)
-            shift = check_bit_shift(mode)
+        chs, stats = elink_stats_chs(chs_data)
+        num_of_frame = stats.hist.sum(axis=1)
+        shifts = check_bit_shift(stats.mode)
 
-            selector(mode_display, freq, num_of_frame, shift, idx, ph, ch,
+        for i, ch in enumerate(chs):
+            selector(hex_pad(int(stats.mode[i])), int(stats.freq[i]),
+                     int(num_of_frame[i]), int(shifts[i]), idx, ph, ch,
                      printout, good_patterns_chs)
 
     # Now try to find optimum phases.
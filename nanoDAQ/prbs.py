@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+#
+# Author: Yipeng Sun
+# License: BSD 2-clause
+# Last Change: Sun Oct 18, 2026 at 10:52 PM +0800
+
+import numpy as np
+
+from tabulate import tabulate
+
+from nanoDAQ.elink import ElinkFrameBatch
+from nanoDAQ.quality import poisson_upper_limit
+from nanoDAQ.gbtclient.fpga_reg import mem_mon_sweep_safe
+
+
+#########
+# PRBS7 #
+#########
+
+# x^7 + x^6 + 1: b[n] = b[n-6] ^ b[n-7]
+PRBS7_ORDER = 7
+PRBS7_TAP = 6
+
+# A single wrong bit fails the check 3 times: Once as b[n], and once as each
+# of the taps of a later bit.
+PRBS7_ERROR_MULTIPLICATION = 3
+
+
+def prbs7(size, seed=0x7f):
+    bits = np.empty(size + PRBS7_ORDER, dtype=np.uint8)
+    bits[:PRBS7_ORDER] = [(seed >> i) & 1 for i in range(PRBS7_ORDER)]
+
+    for n in range(PRBS7_ORDER, bits.size):
+        bits[n] = bits[n-PRBS7_TAP] ^ bits[n-PRBS7_ORDER]
+
+    return bits[PRBS7_ORDER:]
+
+
+# Pack a PRBS7 bitstream into elink bytes, MSB first.
+def prbs7_bytes(size, seed=0x7f):
+    return np.packbits(prbs7(size*8, seed))
+
+
+# Bitstreams of each row of a (K, N) uint8 array, MSB of each byte first.
+def elink_bits(data):
+    return np.unpackbits(np.atleast_2d(np.asarray(data, dtype=np.uint8)),
+                         axis=1)
+
+
+# The checker synchronizes itself: Each bit is predicted from the 7 bits
+# before it, so nothing but the first 7 bits of a row is lost. Return, per
+# row, the number of failed predictions and of bits checked.
+def prbs7_check(data):
+    bits = elink_bits(data)
+    fail = bits[:, PRBS7_ORDER:] ^ \
+        bits[:, PRBS7_ORDER-PRBS7_TAP:-PRBS7_TAP] ^ \
+        bits[:, :-PRBS7_ORDER]
+    return fail.sum(axis=1, dtype=np.int64), \
+        np.full(bits.shape[0], fail.shape[1], dtype=np.int64)
+
+
+################
+# PRBS checker #
+################
+
+# Accumulate PRBS7 checks of successive memory monitoring reads. Reads are
+# not contiguous in time, so every read is checked on its own.
+class PRBSChecker(object):
+    def __init__(self, chs=list(range(14)), cl=0.95):
+        self.chs = list(chs)
+        self.cl = cl
+
+        self.rows = [ElinkFrameBatch.field_index['elk'+str(ch)]
+                     for ch in self.chs]
+        self.fails = np.zeros(len(self.chs), dtype=np.int64)
+        self.bits = np.zeros(len(self.chs), dtype=np.int64)
+        # An all-zero stream passes the check, but it's not PRBS.
+        self.stuck = np.zeros(len(self.chs), dtype=np.int64)
+        self.blocks = 0
+
+    def update(self, batch, timestamp=None):
+        if len(batch) < 1:
+            return
+
+        data = batch.data[self.rows]
+        fails, bits = prbs7_check(data)
+
+        self.fails += fails
+        self.bits += bits
+        self.stuck += ~data.any(axis=1)
+        self.blocks += 1
+
+    def errors(self):
+        return self.fails / PRBS7_ERROR_MULTIPLICATION
+
+    def ber(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            upper = np.array([poisson_upper_limit(int(round(e)), self.cl)
+                              for e in self.errors()]) / self.bits
+            return self.errors() / self.bits, upper
+
+    def locked(self):
+        return (self.stuck == 0) & (self.fails == 0)
+
+    ##########
+    # Output #
+    ##########
+
+    def status(self):
+        return ['no data' if not b else 'stuck' if s else
+                'OK' if not f else 'errors'
+                for b, s, f in zip(self.bits, self.stuck, self.fails)]
+
+    def report(self, output=True, prefix=[]):
+        ber, upper = self.ber()
+        table = [prefix + ['elk'+str(ch), b, f, '{:.2e}'.format(r),
+                           '{:.2e}'.format(u), st]
+                 for ch, b, f, r, u, st in zip(
+                     self.chs, self.bits, self.fails, ber, upper,
+                     self.status())]
+
+        if output:
+            print('PRBS7, reads checked: {}'.format(self.blocks))
+            print(prbs_tabulate(table, self.cl))
+        else:
+            return table
+
+
+def prbs_tabulate(table, cl=0.95, prefix=[]):
+    headers = prefix + ['elink', 'bits', 'check failures', 'BER',
+                        'BER < ({:.0%} CL)'.format(cl), 'status']
+    return tabulate(table, headers=headers,
+                    colalign=['left']*(len(prefix)+1) +
+                    ['right']*4 + ['left'],
+                    disable_numparse=True)
+
+
+#################################
+# Check multiple MiniDAQ fibers #
+#################################
+
+# Return {fiber: checker}.
+def prbs_check_fibers(fibers, num=1, chs=list(range(14))):
+    result = dict()
+
+    for fiber, batches in mem_mon_sweep_safe(
+            fibers, num, concat=False).items():
+        checker = PRBSChecker(chs)
+        for batch in batches:
+            checker.update(batch)
+        result[fiber] = checker
+
+    return result
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+#
+# Author: Yipeng Sun
+# License: BSD 2-clause
+# Last Change: Mon Oct 19, 2026 at 01:41 AM +0800
+
+import math
+import numpy as np
+
+from datetime import datetime
+from tabulate import tabulate
+from time import time
+
+from nanoDAQ.elink import ElinkFrameBatch
+from nanoDAQ.elink import elink_stats, bit_shift_lut
+from nanoDAQ.utils import hex_pad, num_of_bit
+
+
+############################
+# Poisson confidence level #
+############################
+
+def poisson_cdf(k, mu):
+    if mu <= 0:
+        return 1.0
+    return sum(math.exp(i*math.log(mu) - mu - math.lgamma(i+1))
+               for i in range(k+1))
+
+
+def normal_quantile(p, lo=-10, hi=10):
+    while hi - lo > 1e-9:
+        mid = (lo + hi) / 2
+        if (1 + math.erf(mid / math.sqrt(2))) / 2 < p:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+# Upper limit on the mean of a Poisson process that gave 'k' counts, i.e. the
+# 'mu' with P(X <= k | mu) = 1 - cl.
+def poisson_upper_limit(k, cl=0.95):
+    if k == 0:
+        return -math.log(1 - cl)
+
+    # Wilson-Hilferty approximation of the chi2 quantile, good to better than
+    # a percent for this many counts.
+    if k > 50:
+        nu = 2*(k+1)
+        z = normal_quantile(cl)
+        return nu * (1 - 2/(9*nu) + z*math.sqrt(2/(9*nu)))**3 / 2
+
+    lo, hi = float(k), k + 10*math.sqrt(k+1) + 10
+    while hi - lo > 1e-9 * hi:
+        mid = (lo + hi) / 2
+        if poisson_cdf(k, mid) > 1 - cl:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+################
+# Link quality #
+################
+
+# Accumulate per-elink statistics over successive memory monitoring reads.
+# Only a 256-bin histogram and a few counters are kept per field, so memory
+# doesn't grow with the length of the run. Everything else (matches, bit
+# flips, bit shifts) is derived from the histograms.
+class LinkQuality(object):
+    def __init__(self, expected=0xc4, chs=list(range(14)), datavalid=0x80,
+                 header=None, cl=0.95):
+        self.expected = expected
+        self.chs = list(chs)
+        self.datavalid = datavalid
+        # Locked to the most common header of the first read if not specified
+        self.header = header
+        self.cl = cl
+
+        self.rows = [ElinkFrameBatch.field_index['elk'+str(ch)]
+                     for ch in self.chs]
+        self.size = num_of_bit(hex_pad(expected))
+
+        fields = len(ElinkFrameBatch.fields)
+        self.frames = 0
+        self.hist = np.zeros((fields, 256), dtype=np.int64)
+        self.first_error = np.full(fields, np.nan)
+        self.last_error = np.full(fields, np.nan)
+
+    def reference(self):
+        ref = np.full(len(ElinkFrameBatch.fields), self.expected,
+                      dtype=np.intp)
+        ref[ElinkFrameBatch.field_index['tx_datavalid']] = self.datavalid
+        ref[ElinkFrameBatch.field_index['header']] = \
+            0 if self.header is None else self.header
+        return ref
+
+    def update(self, batch, timestamp=None):
+        if not len(batch):
+            return
+
+        timestamp = time() if timestamp is None else timestamp
+        if self.header is None:
+            self.header = int(elink_stats(batch.field('header')).mode[0])
+
+        hist = elink_stats(batch.data).hist
+        ref = self.reference()
+        errors = len(batch) - hist[np.arange(len(ref)), ref]
+
+        bad = errors > 0
+        self.first_error[bad & np.isnan(self.first_error)] = timestamp
+        self.last_error[bad] = timestamp
+
+        self.hist += hist
+        self.frames += len(batch)
+
+    ###################
+    # Derived numbers #
+    ###################
+
+    # Frames that differ from the expected value, for every field.
+    def errors(self):
+        ref = self.reference()
+        return self.frames - self.hist[np.arange(len(ref)), ref]
+
+    def match(self):
+        hist = self.hist[self.rows]
+        return hist[:, self.expected] / self.frames if self.frames \
+            else np.zeros(len(self.rows))
+
+    # (channels, bits) counts of each bit differing from the expected one,
+    # MSB first.
+    def bit_flips(self):
+        xor = np.arange(256, dtype=np.uint8) ^ np.uint8(self.expected)
+        flips = np.unpackbits(xor[:, None], axis=1)[:, -self.size:]
+        return self.hist[self.rows] @ flips
+
+    # (channels, size+1) counts of each bit shift found by
+    # 'nanoDAQ.elink.check_bit_shift'. The last column counts values that
+    # aren't a rotation of the expected one.
+    def shifts(self):
+        lut = bit_shift_lut(self.expected, self.size)
+        hist = self.hist[self.rows, :lut.size]
+        return np.stack([hist[:, lut == s].sum(axis=1)
+                         for s in list(range(self.size)) + [-1]], axis=1)
+
+    # Measured bit error rates and their upper limits at 'cl'.
+    def ber(self):
+        bits = self.frames * self.size
+        errors = self.bit_flips().sum(axis=1)
+        if not bits:
+            return errors, np.full(len(errors), np.nan), \
+                np.full(len(errors), np.nan)
+
+        upper = np.array([poisson_upper_limit(int(e), self.cl)
+                          for e in errors]) / bits
+        return errors, errors / bits, upper
+
+    ##########
+    # Output #
+    ##########
+
+    def report(self, output=True):
+        fmt_time = lambda t: '' if np.isnan(t) else \
+            datetime.fromtimestamp(t).strftime('%m-%d %H:%M:%S')
+        fmt_frac = lambda n: '{:.4%}'.format(n / self.frames) \
+            if self.frames else ''
+
+        errors = self.errors()
+        table = []
+
+        for name in ['tx_datavalid', 'header']:
+            idx = ElinkFrameBatch.field_index[name]
+            table.append([name, fmt_frac(self.frames - errors[idx]),
+                          errors[idx], '', '', '', '', '',
+                          fmt_time(self.first_error[idx]),
+                          fmt_time(self.last_error[idx])])
+
+        bit_errors, ber, upper = self.ber()
+        flips = self.bit_flips()
+        shifts = self.shifts()
+
+        for i, (ch, idx) in enumerate(zip(self.chs, self.rows)):
+            table.append(['elk'+str(ch), fmt_frac(self.frames - errors[idx]),
+                          errors[idx], bit_errors[i],
+                          '-'.join(map(str, flips[i])),
+                          '-'.join(map(str, shifts[i])),
+                          '{:.2e}'.format(ber[i]),
+                          '{:.2e}'.format(upper[i]),
+                          fmt_time(self.first_error[idx]),
+                          fmt_time(self.last_error[idx])])
+
+        if output:
+            print('Frames: {}, expected: {}'.format(
+                self.frames, hex_pad(self.expected)))
+            print(tabulate(table, headers=[
+                'field', 'match', 'bad frames', 'bit errors',
+                'bit flips (MSB first)', 'shifts (0-{}, none)'.format(
+                    self.size-1),
+                'BER', 'BER < ({:.0%} CL)'.format(self.cl),
+                'first error', 'last error'],
+                colalign=['left']+['right']*9, disable_numparse=True))
+        else:
+            return table
@@ -2,7 +2,7 @@
 #
 # Author: Yipeng Sun, Manuel Franco Sevilla
 # License: BSD 2-clause
-# Last Change: Tue Jul 14, 2020 at 08:11 PM +0800
+# Last Change: Mon Oct 19, 2026 at 03:44 AM +0800
 
 import os.path as op
 
@@ -10,15 +10,20 @@ from time import sleep
 from sty import fg, ef, rs
 from tabulate import tabulate
 
+from nanoDAQ.gbtclient.common import to_bytes, bytes_regulator
 from nanoDAQ.gbtclient.i2c import I2C_TYPE, I2C_FREQ
 from nanoDAQ.gbtclient.i2c import i2c_activate_ch, i2c_read, i2c_write
 from nanoDAQ.gbtclient.i2c import i2c_write_verify
 
 from nanoDAQ.gbtclient.gpio import GPIO_DIR_LOOKUP, GPIO_LEVEL_LOOKUP
-from nanoDAQ.gbtclient.gpio import gpio_activate_ch, gpio_setdir, \
-    gpio_setline, gpio_getdir, gpio_getline
+from nanoDAQ.gbtclient.gpio import gpio_activate_ch, gpio_snapshot, \
+    gpio_setdir_mask, gpio_setline_mask, lines_to_mask
 
-from nanoDAQ.utils import dict_factory, num_of_byte, hex_pad
+from nanoDAQ.ut.shadow import shadow_write
+
+from nanoDAQ.exceptions import DCBError
+from nanoDAQ.utils import dict_factory, hex_pad, dirty_ranges
+from nanoDAQ.utils import maybe, wait_until
 
 
 #############
@@ -38,6 +43,11 @@ PRBS_MODE = {
 DCB_SCA = 0
 DCB_SLAVE_I2C_BUS = 6
 
+GBLD_SETTLE_TIME = 0.08  # Give GBTx/GBLD some time to respond
+
+GBTX_STATUS_REG = 0x1af
+GBTX_IDLE = '61'
+
 
 ###############
 # Elink phase #
@@ -64,6 +74,11 @@ DCB_ELK_PHASE_REG = {
 
 DCB_ELK_VALID_PHASE = list(map(lambda x: hex(x)[2:], range(15)))
 
+# All phase registers lie in a contiguous window of the GBTx register map
+DCB_ELK_PHASE_BASE = min(min(r) for r in DCB_ELK_PHASE_REG.values())
+DCB_ELK_PHASE_SIZE = \
+    max(max(r) for r in DCB_ELK_PHASE_REG.values()) - DCB_ELK_PHASE_BASE + 1
+
 
 # We separate this I2C operation to a separate function so that it can be easily
 # wrapped in another process.
@@ -74,6 +89,47 @@ def dcb_elk_phase(gbt, slave, ch, phase):
                   data=phase*2)
 
 
+# Merge a {channel: phase} map into the phase register window, and write back
+# only the span that actually changed. The span is taken from a fresh read of
+# the hardware, as it covers registers of other channels; the shadow is only
+# used to skip the whole operation.
+def dcb_elk_phases(gbt, slave, phases, shadow=None):
+    i2c_args = (gbt, DCB_SCA, DCB_SLAVE_I2C_BUS, slave)
+    i2c_opts = (I2C_TYPE['gbtx'], I2C_FREQ['1MHz'])
+
+    if shadow is not None and all(
+            shadow.known(i2c_args, reg, to_bytes(phase*2))
+            for ch, phase in phases.items()
+            for reg in DCB_ELK_PHASE_REG[ch]):
+        return
+
+    window = bytearray(i2c_read(
+        *i2c_args, DCB_ELK_PHASE_BASE, DCB_ELK_PHASE_SIZE, *i2c_opts,
+        regulator=bytes_regulator))
+    dirty = []
+
+    for ch, phase in phases.items():
+        val = int(phase*2, base=16)
+        for reg in DCB_ELK_PHASE_REG[ch]:
+            if window[reg-DCB_ELK_PHASE_BASE] != val:
+                window[reg-DCB_ELK_PHASE_BASE] = val
+                dirty.append(reg)
+
+    if dirty:
+        start, end = min(dirty), max(dirty) + 1
+        data = bytes(window[start-DCB_ELK_PHASE_BASE:end-DCB_ELK_PHASE_BASE])
+        if shadow is not None:
+            shadow.forget(i2c_args, start, end-start)
+        if shadow is not None and shadow.force:
+            i2c_write_verify(*i2c_args, start, end-start, *i2c_opts,
+                             data=data, error=DCBError)
+        else:
+            i2c_write(*i2c_args, start, end-start, *i2c_opts, data=data)
+
+    if shadow is not None:
+        shadow.update(i2c_args, DCB_ELK_PHASE_BASE, bytes(window))
+
+
 ##################
 # DCB all-in-one #
 ##################
@@ -81,7 +137,8 @@ def dcb_elk_phase(gbt, slave, ch, phase):
 class DCB(object):
     def __init__(self, gbt,
                  sca=DCB_SCA, bus=DCB_SLAVE_I2C_BUS, slaves=list(range(1, 7)),
-                 i2c_type=I2C_TYPE['gbtx'], i2c_freq=I2C_FREQ['1MHz']):
+                 i2c_type=I2C_TYPE['gbtx'], i2c_freq=I2C_FREQ['1MHz'],
+                 shadow=None, timeout=1, interval=0.01):
         self.gbt = gbt
         self.sca = sca
         self.bus = bus
@@ -94,6 +151,13 @@ class DCB(object):
 
         self.i2c_activated = False
 
+        # Optional shadow of registers known to be in the hardware
+        self.shadow = shadow
+
+        # How long, and how often, to poll for the hardware to be ready
+        self.timeout = timeout
+        self.interval = interval
+
     ####################
     # Basic operations #
     ####################
@@ -111,6 +175,35 @@ class DCB(object):
     def dyn_slaves(self, slaves):
         return self.slaves if slaves is None else slaves
 
+    def write_reg(self, slave, subaddr, data, size=None):
+        data = to_bytes(data)
+        size = len(data) if size is None else size
+        return shadow_write(self.shadow, self.gbt, self.sca, self.bus, slave,
+                            subaddr, size, self.i2c_type, self.i2c_freq,
+                            data=data, error=DCBError)
+
+    def invalidate(self, buses):
+        if self.shadow is not None:
+            for b in buses:
+                self.shadow.invalidate((self.gbt, self.sca, b))
+
+    def wait_until(self, cond, descr):
+        return wait_until(cond, self.timeout, self.interval, DCBError, descr)
+
+    def state(self, slave):
+        return i2c_read(self.gbt, self.sca, self.bus, slave,
+                        GBTX_STATUS_REG, 1, self.i2c_type, self.i2c_freq)
+
+    # Wait until the slave answers on the I2C bus at all.
+    def wait_ready(self, slave):
+        self.wait_until(lambda: maybe(self.state, slave)[0],
+                        'slave {} to respond'.format(slave))
+
+    # A busy slave may not acknowledge, which is not an error yet.
+    def wait_idle(self, slave):
+        self.wait_until(lambda: maybe(self.state, slave) == (True, GBTX_IDLE),
+                        'slave {} to be idle'.format(slave))
+
     ##############
     # Initialize #
     ##############
@@ -122,18 +215,61 @@ class DCB(object):
         padded = ['0'+i if len(i) == 1 else i for i in raw]
         return ''.join(padded)
 
-    def init(self, filepath, slaves=None):
+    def init(self, filepath, slaves=None, diff=False, max_gap=4):
         self.activate_i2c()
-        # FIXME: Sleep for no apparent reason
-        sleep(0.2)
         filepath = op.abspath(op.expanduser(filepath))
-        data = self.convert_file_to_reg(filepath)
+        data = bytes.fromhex(self.convert_file_to_reg(filepath))
+
+        if diff:
+            return self.init_diff(data, slaves, max_gap)
 
         for s in self.dyn_slaves(slaves):
+            self.wait_ready(s)
+            if self.shadow is not None:
+                self.shadow.invalidate((self.gbt, self.sca, self.bus, s))
+
             i2c_write_verify(
                 self.gbt, self.sca, self.bus, s, 0, 366,
                 self.i2c_type, self.i2c_freq, data=data)
-            sleep(0.2)
+
+            if self.shadow is not None:
+                self.shadow.update((self.gbt, self.sca, self.bus, s), 0, data)
+            self.wait_idle(s)
+
+    # Only write registers that differ from what's currently loaded.
+    def init_diff(self, target, slaves=None, max_gap=4):
+        size = len(target)
+        table = []
+
+        for s in self.dyn_slaves(slaves):
+            self.wait_ready(s)
+            cur = i2c_read(self.gbt, self.sca, self.bus, s, 0, size,
+                           self.i2c_type, self.i2c_freq,
+                           regulator=bytes_regulator)
+            if len(cur) != size:
+                raise DCBError(
+                    'Slave {}: read back {} bytes, but expect {}.'.format(
+                        s, len(cur), size))
+            ranges = dirty_ranges(cur, target, max_gap)
+
+            for start, end in ranges:
+                if self.shadow is not None:
+                    self.shadow.forget((self.gbt, self.sca, self.bus, s),
+                                       start, end-start)
+                i2c_write_verify(
+                    self.gbt, self.sca, self.bus, s, start, end-start,
+                    self.i2c_type, self.i2c_freq,
+                    data=target[start:end], error=DCBError)
+
+            if self.shadow is not None:
+                self.shadow.update((self.gbt, self.sca, self.bus, s), 0,
+                                   target)
+
+            table.append([s, len(ranges), sum(e-b for b, e in ranges)])
+            if ranges:
+                self.wait_idle(s)
+
+        print(tabulate(table, headers=['slave', 'ranges', 'bytes written']))
 
     ##################
     # I2C write/read #
@@ -143,9 +279,7 @@ class DCB(object):
         self.activate_i2c()
 
         for s in self.dyn_slaves(slaves):
-            i2c_write(self.gbt, self.sca, self.bus, s, subaddr,
-                      num_of_byte(data),
-                      self.i2c_type, self.i2c_freq, data=data)
+            self.write_reg(s, subaddr, data)
 
     def read(self, subaddr, size, slaves=None, output=True):
         self.activate_i2c()
@@ -171,8 +305,7 @@ class DCB(object):
         table = []
 
         for s in self.dyn_slaves(slaves):
-            status = i2c_read(self.gbt, self.sca, self.bus, s, 0x1af, 1,
-                              self.i2c_type, self.i2c_freq)
+            status = self.state(s)
             table_raw.append([s, status])
             table.append([s, GBTX_STATUS[status]])
 
@@ -190,10 +323,9 @@ class DCB(object):
         table_raw = []
         table = []
 
-        for g in self.gpio_chs:
-            dir = gpio_getdir(self.gbt, self.sca, g)
-            line = gpio_getline(self.gbt, self.sca, g)
+        snapshot = gpio_snapshot(self.gbt, self.sca, self.gpio_chs)
 
+        for g, (dir, line) in snapshot.items():
             table_raw.append([g, dir, line])
             table.append([g, GPIO_DIR_LOOKUP[dir], GPIO_LEVEL_LOOKUP[line]])
 
@@ -203,17 +335,27 @@ class DCB(object):
         else:
             return table_raw
 
-    def gpio_reset(self, chs, final_state='high'):
+    # Pulse all lines in 'chs' at the same time.
+    def gpio_reset(self, chs, final_state='high', pulse_width=1):
         self.activate_gpio()
+        # GPIO lines reset the devices on the I2C bus with the same index.
+        self.invalidate(chs)
+        mask = lines_to_mask(chs)
 
-        for c in chs:
-            gpio_setdir(self.gbt, self.sca, c)
-            gpio_setline(self.gbt, self.sca, c, level='low')
-            sleep(1)
-            gpio_setline(self.gbt, self.sca, c, level=final_state)
+        gpio_setdir_mask(self.gbt, self.sca, mask)
+        gpio_setline_mask(self.gbt, self.sca, mask, level='low')
+        sleep(pulse_width)
+        gpio_setline_mask(self.gbt, self.sca, mask, level=final_state)
 
-    def reset(self, final_state='high'):
-        self.gpio_reset(chs=[6], final_state=final_state)
+        # Wait for the slave GBTxs themselves, not for the GPIO lines we drive.
+        # Devices on other buses are left to their own classes, e.g. SALT.
+        if final_state == 'high' and self.bus in chs:
+            self.activate_i2c()
+            for s in self.slaves:
+                self.wait_ready(s)
+
+    def reset(self, final_state='high', pulse_width=1):
+        self.gpio_reset([self.bus], final_state, pulse_width)
 
     ##########################################
     # PRBS register settings for slave GBTxs #
@@ -225,34 +367,47 @@ class DCB(object):
         except KeyError:
             val = mode
 
+        self.activate_i2c()
         for s in self.dyn_slaves(slaves):
-            i2c_write(self.gbt, self.sca, self.bus, s, 0x1c, 1,
-                      self.i2c_type, self.i2c_freq, data=val)
+            self.write_reg(s, 0x1c, val)
 
     #########################################
     # Bias current settings for slave GBTxs #
     #########################################
 
-    def bias_cur_status(self, slaves=None, output=True):
-        self.activate_i2c()
-        self.gbld_addr(slaves)
-        table_raw = []
-        table = []
-
+    # Trigger all slaves first, so that they settle at the same time.
+    def gbld_trigger(self, subaddr, slaves=None):
         for s in self.dyn_slaves(slaves):
-            i2c_write(self.gbt, self.sca, self.bus, s, 0x185, 1,
+            if self.shadow is not None:
+                self.shadow.forget((self.gbt, self.sca, self.bus, s),
+                                   subaddr, 1)
+            i2c_write(self.gbt, self.sca, self.bus, s, subaddr, 1,
                       self.i2c_type, self.i2c_freq, data='c4')
-            sleep(0.08)  # Give GBTx/GBLD some time to respond
+        sleep(GBLD_SETTLE_TIME)
+
+    def bias_cur_read(self, slaves=None):
+        self.gbld_trigger(0x185, slaves)
+
+        table_raw = []
+        for s in self.dyn_slaves(slaves):
             reg = i2c_read(self.gbt, self.sca, self.bus, s, 0x17f, 1,
                            self.i2c_type, self.i2c_freq)
-            cur = self.gbld_reg_to_cur(reg)
-            table_raw.append([s, cur])
+            table_raw.append([s, self.gbld_reg_to_cur(reg)])
 
-            if cur <= 6.1:
-                cur_fmt = fg.green+ef.bold+str(cur)+rs.bold_dim+fg.rs
-            else:
-                cur_fmt = fg.yellow+ef.bold+str(cur)+rs.bold_dim+fg.rs
-            table.append([s, cur_fmt])
+        return table_raw
+
+    @staticmethod
+    def bias_cur_fmt(cur):
+        if cur <= 6.1:
+            return fg.green+ef.bold+str(cur)+rs.bold_dim+fg.rs
+        else:
+            return fg.yellow+ef.bold+str(cur)+rs.bold_dim+fg.rs
+
+    def bias_cur_status(self, slaves=None, output=True):
+        self.activate_i2c()
+        self.gbld_addr(slaves)
+        table_raw = self.bias_cur_read(slaves)
+        table = [[s, self.bias_cur_fmt(cur)] for s, cur in table_raw]
 
         if output:
             print(tabulate(table, headers=['slave', 'current [mA]']))
@@ -265,20 +420,34 @@ class DCB(object):
         gbld_conf = '8799{}88ffff04'.format(reg)
 
         for s in self.dyn_slaves(slaves):
-            i2c_write(self.gbt, self.sca, self.bus, s, 0x37, 7,
-                      self.i2c_type, self.i2c_freq, data=gbld_conf)
+            self.write_reg(s, 0x37, gbld_conf)
 
         self.gbld_addr(slaves)
+        self.gbld_trigger(0x184, slaves)
 
-        for s in self.dyn_slaves(slaves):
-            i2c_write(self.gbt, self.sca, self.bus, s, 0x184, 1,
-                      self.i2c_type, self.i2c_freq, data='c4')
-            sleep(0.08)
+    # Set each of the currents on all slaves, and read them back.
+    def bias_cur_sweep(self, curs, slaves=None, output=True):
+        slaves = self.dyn_slaves(slaves)
+        table_raw = []
+        table = []
+
+        for cur in curs:
+            self.bias_cur_set(cur, slaves)
+            reg = self.gbld_cur_to_reg(cur)
+            readback = [c for _, c in self.bias_cur_read(slaves)]
+
+            table_raw.append([cur, reg] + readback)
+            table.append([cur, reg] + list(map(self.bias_cur_fmt, readback)))
+
+        if output:
+            print(tabulate(table, headers=['set [mA]', 'reg'] +
+                           ['slave {}'.format(s) for s in slaves]))
+        else:
+            return table_raw
 
     def gbld_addr(self, slaves=None):
         for s in self.dyn_slaves(slaves):
-            i2c_write(self.gbt, self.sca, self.bus, s, 0xfd, 1,
-                      self.i2c_type, self.i2c_freq, data='7e')
+            self.write_reg(s, 0xfd, '7e')
 
     @staticmethod
     def gbld_reg_to_cur(reg):
@@ -298,5 +467,9 @@ class DCB(object):
     #######################
 
     def elink_phase(self, ch, phase, slaves=None):
+        self.elink_phases({ch: phase}, slaves)
+
+    def elink_phases(self, phases, slaves=None):
+        self.activate_i2c()
         for s in self.dyn_slaves(slaves):
-            dcb_elk_phase(self.gbt, s, ch, phase)
+            dcb_elk_phases(self.gbt, s, phases, self.shadow)
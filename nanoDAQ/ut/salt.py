@@ -2,19 +2,25 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Fri Jan 17, 2020 at 03:07 AM -0500
+# Last Change: Mon Oct 19, 2026 at 02:37 AM +0800
 
+from concurrent.futures import ThreadPoolExecutor
 from tabulate import tabulate
-from time import sleep
+from time import sleep, time
 
+from nanoDAQ.gbtclient.common import to_bytes
 from nanoDAQ.gbtclient.i2c import I2C_TYPE, I2C_FREQ
 from nanoDAQ.gbtclient.i2c import i2c_activate_ch, i2c_read, i2c_write
+from nanoDAQ.gbtclient.i2c import i2c_compile_seq
 
 from nanoDAQ.gbtclient.gpio import GPIO_LEVEL_INVERSE
 from nanoDAQ.gbtclient.gpio import gpio_activate_ch, gpio_setdir, \
     gpio_setline, gpio_getline
 
-from nanoDAQ.utils import num_of_byte, pad
+from nanoDAQ.ut.shadow import shadow_write
+
+from nanoDAQ.exceptions import SALTError
+from nanoDAQ.utils import pad, maybe, wait_until
 
 
 #############
@@ -43,6 +49,8 @@ SALT_INIT_SEQ = [
     (5, 7, '01'),
 ]
 
+SALT_INIT_PLAN = i2c_compile_seq(SALT_INIT_SEQ)
+
 
 ###############
 # Elink phase #
@@ -94,7 +102,8 @@ def salt_tfc_phase(gbt, bus, asic, phase):
 
 class SALT(object):
     def __init__(self, gbt, bus, sca=0, asics=list(range(4)),
-                 i2c_type=I2C_TYPE['salt'], i2c_freq=I2C_FREQ['100KHz']):
+                 i2c_type=I2C_TYPE['salt'], i2c_freq=I2C_FREQ['100KHz'],
+                 shadow=None):
         self.gbt = gbt
         self.bus = bus
         self.sca = sca
@@ -105,6 +114,9 @@ class SALT(object):
         self.gpio_activated = False
         self.i2c_activated = False
 
+        # Optional shadow of registers known to be in the hardware
+        self.shadow = shadow
+
     ####################
     # Basic operations #
     ####################
@@ -122,19 +134,24 @@ class SALT(object):
     def dyn_asics(self, asics):
         return self.asics if asics is None else asics
 
+    def write_reg(self, addr, subaddr, data):
+        data = to_bytes(data)
+        return shadow_write(self.shadow, self.gbt, self.sca, self.bus, addr,
+                            subaddr, len(data),
+                            self.i2c_type, self.i2c_freq,
+                            data=data, error=SALTError)
+
     ##############
     # Initialize #
     ##############
 
     def init(self, asics=None):
-        self.reset()
+        self.reset(asics=asics)
         self.activate_i2c()
 
         for s in self.dyn_asics(asics):
-            for addr, subaddr, val in SALT_INIT_SEQ:
-                addr = addr_shift(addr, s)
-                i2c_write(self.gbt, self.sca, self.bus, addr, subaddr, 1,
-                          self.i2c_type, self.i2c_freq, data=val)
+            for addr, subaddr, val in SALT_INIT_PLAN:
+                self.write_reg(addr_shift(addr, s), subaddr, val)
 
     ##################
     # I2C write/read #
@@ -144,11 +161,7 @@ class SALT(object):
         self.activate_i2c()
 
         for s in self.dyn_asics(asics):
-            i2c_write(self.gbt, self.sca, self.bus,
-                      addr_shift(addr, s),
-                      subaddr,
-                      num_of_byte(data),
-                      self.i2c_type, self.i2c_freq, data=data)
+            self.write_reg(addr_shift(addr, s), subaddr, data)
 
     def read(self, addr, subaddr, size, asics=None, output=True):
         self.activate_i2c()
@@ -170,20 +183,47 @@ class SALT(object):
     # GPIO reset #
     ##############
 
-    def reset(self, final_state='high'):
+    def line_state(self):
+        return GPIO_LEVEL_INVERSE[gpio_getline(self.gbt, self.sca, self.bus)]
+
+    # Any register will do, as long as the ASIC acknowledges.
+    def asic_ready(self, asic):
+        return maybe(i2c_read, self.gbt, self.sca, self.bus,
+                     addr_shift(0, asic), 0, 1,
+                     self.i2c_type, self.i2c_freq)[0]
+
+    def wait_ready(self, asics=None, timeout=1, interval=0.01):
+        self.activate_i2c()
+        for s in self.dyn_asics(asics):
+            wait_until(lambda: self.asic_ready(s), timeout, interval,
+                       SALTError, 'SALT {} on bus {} to respond'.format(
+                           s, self.bus))
+
+    def reset(self, final_state='high', asics=None, pulse_width=0.1,
+              timeout=1, interval=0.01):
         self.activate_gpio()
+        if self.shadow is not None:
+            self.shadow.invalidate((self.gbt, self.sca, self.bus))
+
         gpio_setdir(self.gbt, self.sca, self.bus)
         gpio_setline(self.gbt, self.sca, self.bus, level='low')
-        sleep(0.1)
+        sleep(pulse_width)
         gpio_setline(self.gbt, self.sca, self.bus, level=final_state)
 
-        line_state = GPIO_LEVEL_INVERSE[gpio_getline(
-            self.gbt, self.sca, self.bus)]
+        line_state = self.line_state()
         if line_state != final_state:
             print('GPIO reported state {}, which differs from specfied state {}'.format(
                 line_state, final_state
             ))
 
+        # Wait for the ASICs themselves to come out of reset. Only report the
+        # ones that don't respond, as they may be missing on purpose.
+        if final_state == 'high':
+            try:
+                self.wait_ready(asics, timeout, interval)
+            except SALTError as e:
+                print(e)
+
         return line_state
 
     #######################
@@ -193,7 +233,7 @@ class SALT(object):
     def phase(self, phase, asics=None):
         self.activate_i2c()
         for s in self.dyn_asics(asics):
-            salt_elk_phase(self.gbt, self.bus, s, phase)
+            self.write_reg(addr_shift(0, s), 0x08, pad(phase))
 
     ###############################
     # Serializer source selection #
@@ -201,8 +241,9 @@ class SALT(object):
 
     def ser_src(self, src, asics=None):
         self.activate_i2c()
+        val = SALT_SER_SRC_MODE.get(src, src)
         for s in self.dyn_asics(asics):
-            salt_ser_src(self.gbt, self.bus, s, src)
+            self.write_reg(addr_shift(0, s), 0, val)
 
     #############
     # TFC phase #
@@ -211,4 +252,42 @@ class SALT(object):
     def tfc_phase(self, phase, asics=None):
         self.activate_i2c()
         for s in self.dyn_asics(asics):
-            salt_tfc_phase(self.gbt, self.bus, s, phase)
+            self.write_reg(addr_shift(0, s), 2, pad(phase))
+
+
+#############################
+# Concurrent initialization #
+#############################
+
+def timed(func, *args, **kwargs):
+    start = time()
+    try:
+        func(*args, **kwargs)
+        return (time() - start, None)
+    except Exception as e:
+        return (time() - start, e)
+
+
+# Run 'SALT.init' of multiple hybrids in threads. GPIO and I2C operations of
+# different hybrids overlap, while operations on the same gbtserv command
+# service take turns.
+def salt_init_all(salts, asics=None):
+    with ThreadPoolExecutor(len(salts)) as executor:
+        return list(executor.map(lambda s: timed(s.init, asics), salts))
+
+
+def salt_init_concurrent(salts, asics=None, output=True):
+    results = salt_init_all(salts, asics)
+    table_raw = [[s.gbt, s.bus, t, e] for s, (t, e) in zip(salts, results)]
+
+    if not output:
+        return table_raw
+
+    print(tabulate([[g, b, '{:.3f}'.format(t), 'OK' if e is None else e]
+                    for g, b, t, e in table_raw],
+                   headers=['GBT', 'bus', 'time [s]', 'status']))
+
+    failed = [(g, b) for g, b, _, e in table_raw if e is not None]
+    if failed:
+        raise SALTError('Initialization failed on (GBT, bus): {}'.format(
+            ', '.join(map(str, failed))))
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+#
+# Author: Yipeng Sun
+# License: BSD 2-clause
+# Last Change: Mon Oct 19, 2026 at 02:10 AM +0800
+
+import json
+import os
+import os.path as op
+
+from threading import RLock
+
+from nanoDAQ.gbtclient.common import to_bytes
+from nanoDAQ.gbtclient.i2c import i2c_write, i2c_write_verify
+from nanoDAQ.exceptions import GBTError
+
+
+#############
+# Constants #
+#############
+
+SHADOW_FILE = op.join(op.expanduser('~'), '.cache', 'nanoDAQ', 'shadow.json')
+
+
+#########################
+# Register shadow cache #
+#########################
+
+# Remember register values known to be in the hardware, per
+# (gbt, sca, bus, addr), i.e. per slave GBTx or SALT ASIC.
+class RegShadow(object):
+    def __init__(self, filepath=None, force=False, passive=False):
+        self.filepath = filepath
+        # When forced, every write goes to the hardware and is verified.
+        self.force = force
+        # When passive, nothing is skipped, and registers written are
+        # forgotten instead, as the cache is not trusted for this run.
+        self.passive = passive
+        self.regs = {}
+        # Hybrids may be programmed from multiple threads.
+        self.lock = RLock()
+
+        if filepath and op.isfile(filepath):
+            self.load()
+
+    def known(self, key, subaddr, data):
+        if self.force or self.passive:
+            return False
+
+        regs = self.regs.get(key, {})
+        return all(regs.get(subaddr+i) == d for i, d in enumerate(data))
+
+    def get(self, key, subaddr, size):
+        regs = self.regs.get(key, {})
+        try:
+            return bytes(regs[subaddr+i] for i in range(size))
+        except KeyError:
+            return None
+
+    def update(self, key, subaddr, data):
+        if self.passive:
+            return self.forget(key, subaddr, len(data))
+
+        with self.lock:
+            regs = self.regs.setdefault(key, {})
+            for i, d in enumerate(data):
+                regs[subaddr+i] = d
+
+    # Call 'forget' and 'invalidate' before writing to the hardware: They are
+    # saved right away, so that a run failing halfway doesn't leave old values
+    # in the file.
+    def forget(self, key, subaddr, size):
+        with self.lock:
+            regs = self.regs.get(key, {})
+            dropped = [regs.pop(subaddr+i) for i in range(size)
+                       if subaddr+i in regs]
+            if dropped:
+                self.save()
+
+    def invalidate(self, prefix=()):
+        with self.lock:
+            dropped = [k for k in self.regs if k[:len(prefix)] == prefix]
+            for key in dropped:
+                del self.regs[key]
+            if dropped:
+                self.save()
+
+    ###############
+    # Persistence #
+    ###############
+
+    def load(self):
+        with open(self.filepath) as f:
+            raw = json.load(f)
+
+        self.regs = {tuple(map(int, k.split(','))):
+                     {int(s): v for s, v in regs.items()}
+                     for k, regs in raw.items()}
+
+    def save(self):
+        if not self.filepath:
+            return
+        # Nothing to forget
+        if self.passive and not op.isfile(self.filepath):
+            return
+
+        os.makedirs(op.dirname(self.filepath), exist_ok=True)
+        tmp = self.filepath + '.tmp'
+        with self.lock:
+            with open(tmp, 'w') as f:
+                json.dump({','.join(map(str, k)): regs
+                           for k, regs in self.regs.items()}, f)
+            os.replace(tmp, self.filepath)
+
+
+# Without '--cache', the shadow is still kept in sync, so that it doesn't
+# claim values overwritten by this run.
+def shadow_from_args(args, filepath=SHADOW_FILE):
+    if args.cache or args.refresh:
+        return RegShadow(filepath, force=args.refresh)
+    return RegShadow(filepath, passive=True)
+
+
+# For scripts that write registers without going through a shadow.
+def shadow_invalidate(prefixes, filepath=SHADOW_FILE):
+    shadow = RegShadow(filepath, passive=True)
+    for p in prefixes:
+        shadow.invalidate(p)
+
+
+##########################
+# Shadowed I2C operation #
+##########################
+
+# 'args' are the positional arguments of 'i2c_write', i.e.
+# (gbt, sca, bus, addr, sub_addr, size, i2c_type, i2c_freq).
+def shadow_write(shadow, *args, data, error=GBTError):
+    if shadow is None:
+        i2c_write(*args, data=data)
+        return True
+
+    key, subaddr = args[:4], args[4]
+    raw = to_bytes(data)
+
+    if shadow.known(key, subaddr, raw):
+        return False
+
+    shadow.forget(key, subaddr, len(raw))
+    if shadow.force:
+        i2c_write_verify(*args, data=raw, error=error)
+    else:
+        i2c_write(*args, data=raw)
+
+    shadow.update(key, subaddr, raw)
+    return True
@@ -2,11 +2,15 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Wed Dec 18, 2019 at 05:39 AM -0500
+# Last Change: Mon Oct 19, 2026 at 03:44 AM +0800
 
 from collections import defaultdict, Counter
 from argparse import Action
-from multiprocessing import Pool
+from atexit import register
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from time import sleep, time
 
 from nanoDAQ.exceptions import ExecError
 
@@ -50,9 +54,10 @@ def chunks(lst, size=16):
     return [lst[i:i+size] for i in range(0, len(lst), size)]
 
 
+# Rotate left by 'shift' bits.
 def bit_shift(n, shift, size=8):
-    s = bin_pad(n, size=size)
-    return int(''.join([s[shift:size], s[0:shift]]), base=2)
+    shift %= size
+    return ((n << shift) | (n >> (size - shift))) & ((1 << size) - 1)
 
 
 def most_common(lst):
@@ -61,6 +66,41 @@ def most_common(lst):
     return (mc, data[mc])
 
 
+# Return [start, end) ranges where 'cur' and 'target' differ. Ranges separated
+# by no more than 'max_gap' identical bytes are merged, as it's cheaper to
+# rewrite a few bytes than to start another transaction.
+def dirty_ranges(cur, target, max_gap=0):
+    if len(cur) != len(target):
+        raise ValueError('Cannot compare {} bytes to {} bytes.'.format(
+            len(cur), len(target)))
+    ranges = []
+
+    for i, (c, t) in enumerate(zip(cur, target)):
+        if c == t:
+            continue
+        if ranges and i - ranges[-1][1] <= max_gap:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+
+    return [tuple(r) for r in ranges]
+
+
+# Poll 'cond' until it returns something truthy, and return that.
+def wait_until(cond, timeout=1, interval=0.01, error=TimeoutError,
+               descr='condition'):
+    deadline = time() + timeout
+
+    while True:
+        ret = cond()
+        if ret:
+            return ret
+        if time() >= deadline:
+            raise error('Timed out after {} s waiting for {}.'.format(
+                timeout, descr))
+        sleep(interval)
+
+
 #######################
 # Command line parser #
 #######################
@@ -73,6 +113,16 @@ def add_default_subparser(subparsers, name, description):
                      default=0,
                      help='''
 specify GBT index.
+''')
+    cmd.add_argument('--cache',
+                     action='store_true',
+                     help='''
+skip I2C writes of values known to be in the registers already.
+''')
+    cmd.add_argument('--refresh',
+                     action='store_true',
+                     help='''
+write and verify all registers, then rebuild the register cache.
 ''')
 
     return cmd
@@ -83,6 +133,12 @@ class HexToIntAction(Action):
         setattr(namespace, self.dest, int(value, base=16))
 
 
+# For positional arguments followed by sub-commands, where 'nargs' can't be
+# used. e.g. '0,1,2'
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
 #####################
 # Run in subprocess #
 #####################
@@ -94,24 +150,70 @@ def maybe(f, *args, **kwargs):
         return (False, e)
 
 
-def run_in_proc(f, pool, *args, **kwargs):
-    return pool.apply_async(maybe, (f,)+args, kwargs).get()
+def maybe_retry(f, max_retry, *args, **kwargs):
+    # NOTE: Retry inside the worker, so that a failed DIM round-trip doesn't
+    #       cost a trip back to the parent process.
+    for _ in range(max_retry):
+        status, ret = maybe(f, *args, **kwargs)
+        if status:
+            break
 
+    return (status, ret)
 
-def exec_guard(f, *args, max_retry=3, **kwargs):
-    trial = 0
-    pool = Pool(1)
 
-    while trial < max_retry:
-        status, ret = run_in_proc(f, pool, *args, **kwargs)
-        if status:
-            pool.close()
-            pool.join()
-            return ret
-        else:
-            trial += 1
+class ExecPool(object):
+    def __init__(self, max_respawn=3, inline=False):
+        self.max_respawn = max_respawn
+        self.inline = inline
+        self.executor = None
+
+    def spawn(self):
+        # The worker is long-lived, so pydim is only initialized once and the
+        # DIM connections stay warm between calls.
+        # NOTE: The worker may be (re)spawned after the parent has used DIM,
+        #       whose threads and locks don't survive a fork, so start it
+        #       from a fresh interpreter instead.
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                1, mp_context=get_context('spawn'))
+        return self.executor
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+    def run(self, f, *args, max_retry=3, **kwargs):
+        if self.inline:
+            return maybe_retry(f, max_retry, *args, **kwargs)
+
+        respawn = 0
+
+        while True:
+            try:
+                return self.spawn().submit(
+                    maybe_retry, f, max_retry, *args, **kwargs).result()
+            except BrokenProcessPool:
+                # The worker actually crashed (e.g. segfault inside DIM), so
+                # replace it with a fresh one.
+                self.shutdown(wait=False)
+                respawn += 1
+
+                if respawn > self.max_respawn:
+                    raise ExecError(
+                        'Worker crashed {} times when executing {}!'.format(
+                            respawn, f.__name__))
+
+
+EXEC_POOL = ExecPool()
+register(EXEC_POOL.shutdown)
+
+
+def exec_guard(f, *args, max_retry=3, pool=EXEC_POOL, **kwargs):
+    status, ret = pool.run(f, *args, max_retry=max_retry, **kwargs)
+
+    if status:
+        return ret
 
-    pool.close()
-    pool.join()
     raise ExecError('Cannot execute {}! The raw exception is {}: {}'.format(
         f.__name__, ret.__class__.__name__, str(ret)))
@@ -2,7 +2,7 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Fri Jan 17, 2020 at 03:33 AM -0500
+# Last Change: Sun Oct 18, 2026 at 11:20 PM +0800
 
 from argparse import ArgumentParser, ArgumentTypeError
 from tabulate import tabulate
@@ -11,6 +11,7 @@ from nanoDAQ.gbtclient.fpga_reg import mem_mon_read_safe as mem_r
 from nanoDAQ.gbtclient.fpga_reg import mem_mon_fiber_write_safe as fiber_w
 from nanoDAQ.gbtclient.fpga_reg import mem_mon_options_write_safe as opts_w
 
+from nanoDAQ.capture import CaptureWriter
 from nanoDAQ.utils import hex_pad
 from nanoDAQ.elink import print_elink_table, highlight_chs
 
@@ -18,6 +19,9 @@ from nanoDAQ.phase import loop_phase_elk, scan_phase_elink
 from nanoDAQ.phase import adj_dcb_elink_phase, adj_salt_elink_phase
 from nanoDAQ.phase import salt_tfc_mode, adj_salt_tfc_phase
 
+from nanoDAQ.ut.dcb import DCB_SCA, DCB_SLAVE_I2C_BUS
+from nanoDAQ.ut.shadow import shadow_invalidate
+
 
 ###########
 # Helpers #
@@ -122,6 +126,12 @@ specify if adjust elink phase.
 specify if adjust TFC phase.
                         ''')
 
+    parser.add_argument('--save',
+                        default=None,
+                        help='''
+save raw frames of the elink phase scan to a capture file.
+                        ''')
+
     return parser
 
 
@@ -129,6 +139,11 @@ if __name__ == '__main__':
     parser = parse_input()
     args = parser.parse_args()
 
+    # DCB elink phases and SALT registers are written without the register
+    # cache of dcbutil.py/saltutil.py, so it must forget them.
+    shadow_invalidate([(args.gbt, DCB_SCA, DCB_SLAVE_I2C_BUS, args.slave),
+                       (args.gbt, 0, args.bus)])
+
     opts_w()  # Enable memory monitoring options. (looping, etc.)
     fiber_w(args.channel)  # Select specified MiniDAQ channel.
 
@@ -161,7 +176,11 @@ if __name__ == '__main__':
 
     if elk_op:
         print('Generating phase-scanning table, this may take awhile...')
-        elk_scan_raw = loop_phase_elk(daq_chs, args.gbt, args.slave)
+        capture = CaptureWriter(args.save) if args.save else None
+        elk_scan_raw = loop_phase_elk(daq_chs, args.gbt, args.slave,
+                                      capture=capture, fiber=args.channel)
+        if capture is not None:
+            capture.close()
         elk_scan_tab, elk_adj, elk_pattern = scan_phase_elink(elk_scan_raw)
         print(tabulate(elk_scan_tab, headers=['phase']+daq_chs,
               colalign=['left']+['right']*len(daq_chs)))
@@ -2,14 +2,16 @@
 #
 # Author: Yipeng Sun
 # License: BSD 2-clause
-# Last Change: Fri Jan 17, 2020 at 02:55 AM -0500
+# Last Change: Mon Oct 19, 2026 at 02:37 AM +0800
 
 import sys
 
 from argparse import ArgumentParser
 
 from nanoDAQ.ut.salt import SALT, SALT_SER_SRC_MODE, SALT_TFC_VALID_PHASE
-from nanoDAQ.utils import add_default_subparser, HexToIntAction
+from nanoDAQ.ut.salt import salt_init_concurrent
+from nanoDAQ.ut.shadow import shadow_from_args
+from nanoDAQ.utils import add_default_subparser, HexToIntAction, int_list
 
 
 #################################
@@ -33,15 +35,23 @@ def add_salt_default_subparser(*args, add_asics=True, **kwargs):
 def parse_input(descr='SALT programming utility.'):
     parser = ArgumentParser(description=descr)
     parser.add_argument('bus',
-                        type=int,
+                        type=int_list,
                         help='''
-specify I2C bus (GPIO bus has the same index as I2C bus).''')
+specify I2C bus (GPIO bus has the same index as I2C bus). multiple buses can
+be specified, separated by ',', e.g. 0,1,2.''')
 
     cmd = parser.add_subparsers(dest='cmd')
 
-    add_salt_default_subparser(cmd, 'init', description='''
+    init_cmd = add_salt_default_subparser(cmd, 'init', description='''
 initialize specified ASICs with default configuration.
     ''')
+    init_cmd.add_argument('--gbts',
+                          nargs='+',
+                          type=int,
+                          default=None,
+                          help='''
+specify multiple GBT indices. all buses on all GBTs are initialized at once.
+    ''')
 
     ser_src_cmd = add_salt_default_subparser(cmd, 'ser_src', description='''
 control serializer register.
@@ -123,28 +133,45 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     if args.cmd:
-        salt = SALT(args.gbt, args.bus)
+        shadow = shadow_from_args(args)
+        gbts = getattr(args, 'gbts', None) or [args.gbt]
+        # Each hybrid only once, e.g. for '0,0'
+        hybrids = dict.fromkeys((g, b) for g in gbts for b in args.bus)
+        salts = [SALT(g, b, shadow=shadow) for g, b in hybrids]
     else:
         parser.print_help()
         sys.exit(1)
 
-    if args.cmd == 'init':
-        salt.init(args.asics)
+    # Also save what was forgotten when a write fails halfway.
+    try:
+        if args.cmd == 'init' and len(salts) > 1:
+            salt_init_concurrent(salts, args.asics)
+            salts = []
+
+        for salt in salts:
+            if len(salts) > 1:
+                print('GBT {}, bus {}:'.format(salt.gbt, salt.bus))
+
+            if args.cmd == 'init':
+                salt.init(args.asics)
+
+            elif args.cmd == 'ser_src':
+                salt.ser_src(args.src, args.asics)
 
-    elif args.cmd == 'ser_src':
-        salt.ser_src(args.src, args.asics)
+            elif args.cmd == 'write':
+                salt.write(args.addr, args.reg, args.val, args.asics)
 
-    elif args.cmd == 'write':
-        salt.write(args.addr, args.reg, args.val, args.asics)
+            elif args.cmd == 'read':
+                salt.read(args.addr, args.reg, args.size, args.asics)
 
-    elif args.cmd == 'read':
-        salt.read(args.addr, args.reg, args.size, args.asics)
+            elif args.cmd == 'reset':
+                salt.reset(args.final_state, args.asics)
 
-    elif args.cmd == 'reset':
-        salt.reset(args.final_state)
+            elif args.cmd == 'phase':
+                salt.phase(args.phase, args.asics)
 
-    elif args.cmd == 'phase':
-        salt.phase(args.phase, args.asics)
+            elif args.cmd == 'tfc_phase':
+                salt.tfc_phase(args.phase, args.asics)
 
-    elif args.cmd == 'tfc_phase':
-        salt.tfc_phase(args.phase, args.asics)
+    finally:
+        shadow.save()